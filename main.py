@@ -4,6 +4,9 @@ import runpy
 
 SRC_FOLDER = 'src'
 
+# The scripts import each other (e.g. the Boolean model uses indexing.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), SRC_FOLDER))
+
 def run_script(script_name):
     script_path = os.path.join(SRC_FOLDER, script_name)
 
@@ -34,6 +37,10 @@ def main():
         print("3. Boolean model (boolean-model.py)")
         print("4. Vector model (vector-model.py)")
         print("5. Probabilistic model (probabilistic.py)")
+        print("6. Query server (server.py)")
+        print("7. Co-occurrence query expansion (cooccurrence.py)")
+        print("8. Sharded index (sharding.py)")
+        print("9. Ranked search with a latency budget (impacts.py)")
         print("0. Exir")
         print("=======================================================")
 
@@ -49,6 +56,14 @@ def main():
             run_script('vector-model.py')
         elif choice == '5':
             run_script('probabilistic.py')
+        elif choice == '6':
+            run_script('server.py')
+        elif choice == '7':
+            run_script('cooccurrence.py')
+        elif choice == '8':
+            run_script('sharding.py')
+        elif choice == '9':
+            run_script('impacts.py')
         elif choice == '0':
             print("Exiting...")
             break
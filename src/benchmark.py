@@ -0,0 +1,355 @@
+import os
+import re
+import sys
+import json
+import time
+import runpy
+import random
+import argparse
+import platform
+import unicodedata
+from array import array
+from itertools import accumulate
+from collections import Counter
+from contextlib import redirect_stdout
+
+from indexing import InvertedIndex
+import normalization
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+# Benchmark defaults
+DEFAULT_SIZES = [2000, 4000, 8000, 16000]
+DOC_LENGTH = 120 # Tokens per synthetic document
+SEED = 42
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Retrieval benchmark defaults
+RETRIEVAL_DOCS = 5000
+RETRIEVAL_QUERIES = 500
+RETRIEVAL_VOCAB = 20000
+ZIPF_EXPONENT = 1.0 # Term rank r is drawn with probability ~ 1 / r^s
+QUERY_TERMS = (1, 4) # Terms per query (min, max)
+FEEDBACK_ROUNDS = 2 # Relevance feedback rounds per probabilistic query
+TOP_K = 10
+
+# Function to generate a synthetic corpus
+def synthetic_counts(n_docs, doc_length=DOC_LENGTH, seed=SEED):
+    # The vocabulary grows with the corpus (roughly like real text),
+    # so a builder that is O(V * N) shows up as quadratic here.
+    rng = random.Random(seed)
+    vocab_size = max(1000, n_docs * 5)
+    documents = []
+
+    for i in range(n_docs):
+        # Skewed term choice: a few frequent terms, a long tail of rare ones
+        tokens = [f"t{int(vocab_size ** rng.random())}" for _ in range(doc_length)]
+        documents.append((f"doc{i:07d}.rep", Counter(tokens)))
+
+    return documents
+
+# Function to time the index builder for several corpus sizes
+def benchmark_build(sizes, repeat=3):
+    results = []
+
+    for n_docs in sizes:
+        documents = synthetic_counts(n_docs)
+        best = float('inf')
+
+        for _ in range(repeat):
+            index = InvertedIndex()
+            start = time.perf_counter()
+            index.build_from_counts(documents)
+            best = min(best, time.perf_counter() - start)
+
+        n_postings = sum(len(counts) for _, counts in documents)
+        results.append((n_docs, len(index.vocab_list), n_postings, best))
+
+    return results
+
+def print_build_report(results):
+    print(f"{'Docs':>10} {'Terms':>10} {'Postings':>12} {'Time (s)':>10} {'us/posting':>12} {'Growth':>8}")
+    print("-" * 68)
+
+    previous = None
+    for n_docs, n_terms, n_postings, seconds in results:
+        growth = f"x{seconds / previous:.2f}" if previous else "-"
+        print(f"{n_docs:>10} {n_terms:>10} {n_postings:>12} {seconds:>10.3f} "
+              f"{seconds / n_postings * 1e6:>12.3f} {growth:>8}")
+        previous = seconds
+
+# Previous per-call implementation of normalize_term, kept as the reference for the benchmark
+def normalize_term_uncached(term):
+    term = term.lower().strip()
+    nfkd_form = unicodedata.normalize('NFD', term)
+    term = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+    term = re.sub(r'[^\w\s]', '', term)
+    return term
+
+def synthetic_words(n_words, vocab_size=20000, seed=SEED):
+    # Spanish-like surface forms (accents, capitals, punctuation), skewed like real text
+    rng = random.Random(seed)
+    syllables = ['ca', 'ción', 'pé', 'rez', 'Ma', 'drí', 'gue', 'ño', 'lo', 'sú', 'ma', 'es']
+    vocab = []
+    for _ in range(vocab_size):
+        word = "".join(rng.choice(syllables) for _ in range(rng.randint(1, 4)))
+        vocab.append(word + rng.choice(['', '', '', ',', '.']))
+    return [vocab[int(vocab_size ** rng.random()) - 1] for _ in range(n_words)]
+
+# Function to measure term normalization throughput (tokens per second)
+def benchmark_normalization(n_words=200000):
+    words = synthetic_words(n_words)
+    results = []
+
+    for name, func in [("uncached NFD + re.sub", normalize_term_uncached),
+                       ("translate table + LRU", normalization.normalize_term)]:
+        if hasattr(func, 'cache_clear'):
+            func.cache_clear()
+        start = time.perf_counter()
+        for word in words:
+            func(word)
+        seconds = time.perf_counter() - start
+        results.append((name, n_words / seconds))
+
+    return results
+
+def print_normalization_report(results):
+    print(f"{'Implementation':<28} {'Tokens/s':>14} {'Speedup':>8}")
+    print("-" * 52)
+    baseline = results[0][1]
+    for name, rate in results:
+        print(f"{name:<28} {rate:>14,.0f} {rate / baseline:>7.2f}x")
+
+# Functions to generate a reproducible Zipf corpus and query set
+def zipf_vocabulary(vocab_size):
+    # Distinct letter-only words (base-26 rank), so no normalization step changes them
+    vocab = []
+    for rank in range(vocab_size):
+        word = ""
+        rank += 1
+        while rank:
+            rank, digit = divmod(rank - 1, 26)
+            word = chr(ord('a') + digit) + word
+        vocab.append("w" + word)
+    return vocab
+
+class ZipfSampler:
+    def __init__(self, vocab, exponent, rng):
+        self.vocab = vocab
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(vocab) + 1)))
+        self.rng = rng
+
+    def sample(self, k):
+        return self.rng.choices(self.vocab, cum_weights=self.cum_weights, k=k)
+
+def zipf_corpus(n_docs, doc_length=DOC_LENGTH, vocab_size=RETRIEVAL_VOCAB,
+                exponent=ZIPF_EXPONENT, seed=SEED):
+    # Returns the vocabulary and the documents as (filename, raw text) pairs.
+    # Document lengths vary around doc_length; the raw text has capitals and punctuation.
+    rng = random.Random(seed)
+    vocab = zipf_vocabulary(vocab_size)
+    sampler = ZipfSampler(vocab, exponent, rng)
+    documents = []
+
+    for i in range(n_docs):
+        tokens = sampler.sample(rng.randint(doc_length // 2, doc_length * 3 // 2))
+        words = [t.capitalize() + "," if rng.random() < 0.05 else t for t in tokens]
+        documents.append((f"doc{i:07d}.rep", " ".join(words)))
+
+    return vocab, documents
+
+def zipf_queries(vocab, n_queries, exponent=ZIPF_EXPONENT, seed=SEED):
+    # Query terms follow the same distribution as the documents
+    rng = random.Random(seed + 1)
+    sampler = ZipfSampler(vocab, exponent, rng)
+    return [sampler.sample(rng.randint(*QUERY_TERMS)) for _ in range(n_queries)]
+
+def boolean_queries(queries, seed=SEED):
+    rng = random.Random(seed + 2)
+    result = []
+    for terms in queries:
+        query = terms[0]
+        for term in terms[1:]:
+            query += " " + rng.choice(["AND", "OR", "AND NOT"]) + " " + term
+        result.append(query)
+    return result
+
+# Functions to measure
+def peak_rss_mb():
+    # Largest resident set of the process so far: it never decreases, so it is the
+    # high-water mark of everything run before, not the memory of the last stage
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def latency_report(latencies, items=None):
+    # Throughput and latency percentiles of a list of per-call times (seconds)
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 4)
+
+    return {
+        'calls': len(ordered),
+        'total_s': round(total, 4),
+        'throughput_per_s': round((items or len(ordered)) / total, 1) if total > 0 else None,
+        'p50_ms': percentile(50),
+        'p99_ms': percentile(99),
+        'process_peak_rss_mb': peak_rss_mb(), # cumulative, see peak_rss_mb
+    }
+
+def timed_calls(func, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+# Function to benchmark normalization, indexing and the three models on a Zipf corpus
+def benchmark_retrieval(n_docs=RETRIEVAL_DOCS, n_queries=RETRIEVAL_QUERIES, vocab_size=RETRIEVAL_VOCAB,
+                        exponent=ZIPF_EXPONENT, seed=SEED):
+    vocab, documents = zipf_corpus(n_docs, vocab_size=vocab_size, exponent=exponent, seed=seed)
+    queries = zipf_queries(vocab, n_queries, exponent, seed)
+    stages = {}
+
+    # Throughput is per call, except clean_text (tokens/s), build_index (postings/s)
+    # and vector_search_batch (queries/s)
+    # clean_text
+    cleaned = []
+    latencies = []
+    for _, text in documents:
+        start = time.perf_counter()
+        tokens = normalization.clean_text(text, set())
+        latencies.append(time.perf_counter() - start)
+        cleaned.append(tokens)
+    stages['clean_text'] = latency_report(latencies, sum(len(t) for t in cleaned))
+
+    # build_index (a single call; throughput in postings/s)
+    counts = [(name, Counter(tokens)) for (name, _), tokens in zip(documents, cleaned)]
+    index = InvertedIndex()
+    latencies = timed_calls(index.build_from_counts, [(counts,)])
+    stages['build_index'] = latency_report(latencies, sum(len(c) for _, c in counts))
+
+    # Vector model: SearchEngine.search (top-k)
+    vector = runpy.run_path(os.path.join(SRC_DIR, 'vector-model.py'), run_name='benchmark')
+    engine = vector['SearchEngine']()
+    engine.set_counts([name for name, _ in counts], [doc_counts for _, doc_counts in counts])
+    query_vectors = [(engine.get_query_vector(" ".join(terms)), TOP_K) for terms in queries]
+    stages['vector_search'] = latency_report(timed_calls(engine.search, query_vectors))
+
+    # Vector model: the same queries through SearchEngine.search_batch (a single call;
+    # throughput in queries/s, to compare with vector_search)
+    def batch_search(query_strs):
+        for _ in engine.search_batch(query_strs, TOP_K):
+            pass
+    latencies = timed_calls(batch_search, [([" ".join(terms) for terms in queries],)])
+    stages['vector_search_batch'] = latency_report(latencies, len(queries))
+
+    # Boolean model: parse and evaluate over the inverted index
+    boolean = runpy.run_path(os.path.join(SRC_DIR, 'boolean-model.py'), run_name='benchmark')
+    compile_query = boolean['compile_query']
+    def boolean_query(raw_query):
+        compile_query(raw_query).evaluate(index)
+    stages['boolean'] = latency_report(timed_calls(boolean_query, [(q,) for q in boolean_queries(queries, seed)]))
+
+    # Probabilistic model: initial ranking plus FEEDBACK_ROUNDS rounds marking the top 3 as relevant
+    probabilistic = runpy.run_path(os.path.join(SRC_DIR, 'probabilistic.py'), run_name='benchmark')
+    rank_documents = probabilistic['rank_documents']
+    postings = {}
+    for doc, (_, doc_counts) in enumerate(counts):
+        for term in doc_counts:
+            postings.setdefault(term, array('I')).append(doc)
+
+    def feedback_session(terms):
+        # Same bookkeeping as probabilistic.resolve_query
+        query_postings = {term: set(postings.get(term, ())) for term in terms}
+        relevant = set()
+        relevant_counts = Counter()
+        ranking = rank_documents(terms, postings, len(counts), relevant_counts, 0)
+        for _ in range(FEEDBACK_ROUNDS):
+            for doc, _ in ranking[:3]:
+                if doc not in relevant:
+                    relevant.add(doc)
+                    for term, docs in query_postings.items():
+                        if doc in docs:
+                            relevant_counts[term] += 1
+            ranking = rank_documents(terms, postings, len(counts), relevant_counts, len(relevant))
+    stages['probabilistic_feedback'] = latency_report(timed_calls(feedback_session, [(q,) for q in queries]))
+
+    return {
+        'config': {'docs': n_docs, 'queries': n_queries, 'vocab_size': vocab_size,
+                   'zipf_exponent': exponent, 'seed': seed, 'top_k': TOP_K,
+                   'feedback_rounds': FEEDBACK_ROUNDS},
+        'python': platform.python_version(),
+        'terms': len(index.vocab_list),
+        'postings': sum(len(c) for _, c in counts),
+        # Bytes of the compressed postings and of the front-coded term dictionary
+        'postings_bytes': index.store.nbytes(),
+        'terms_bytes': index.vocab_list.nbytes(),
+        'stages': stages,
+        'process_peak_rss_mb': peak_rss_mb(),
+    }
+
+def print_retrieval_report(report):
+    config = report['config']
+    print(f"{config['docs']} documents, {report['terms']} terms, {report['postings']} postings, "
+          f"{config['queries']} queries (Zipf s={config['zipf_exponent']}, seed {config['seed']})")
+    print(f"Index size: postings {report['postings_bytes'] / 2**20:.2f} MB, "
+          f"term dictionary {report['terms_bytes'] / 2**20:.2f} MB")
+    print(f"{'Stage':<24} {'Calls':>7} {'Total (s)':>10} {'Per second':>14} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print("-" * 80)
+    for name, stage in report['stages'].items():
+        throughput = f"{stage['throughput_per_s']:,.0f}" if stage['throughput_per_s'] else "-"
+        print(f"{name:<24} {stage['calls']:>7} {stage['total_s']:>10.3f} {throughput:>14} "
+              f"{stage['p50_ms']:>10.3f} {stage['p99_ms']:>10.3f}")
+    if report['process_peak_rss_mb'] is not None:
+        print(f"Peak RSS of the process (whole run, not per stage): {report['process_peak_rss_mb']} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks on synthetic corpora.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Corpus sizes (number of documents) to build.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per size (best time is kept).")
+    parser.add_argument('--suite', choices=['all', 'build', 'normalize', 'retrieval'], default='all',
+                        help="Benchmark to run.")
+    parser.add_argument('--docs', type=int, default=RETRIEVAL_DOCS, help="Retrieval suite: documents.")
+    parser.add_argument('--queries', type=int, default=RETRIEVAL_QUERIES, help="Retrieval suite: queries.")
+    parser.add_argument('--vocab', type=int, default=RETRIEVAL_VOCAB, help="Retrieval suite: vocabulary size.")
+    parser.add_argument('--zipf', type=float, default=ZIPF_EXPONENT, help="Retrieval suite: Zipf exponent.")
+    parser.add_argument('--seed', type=int, default=SEED, help="Retrieval suite: random seed.")
+    parser.add_argument('--json', metavar='PATH',
+                        help="Save the retrieval report as JSON ('-' for standard output).")
+    args = parser.parse_args()
+
+    # With '--json -' the standard output only gets the JSON report: the tables go to stderr
+    with redirect_stdout(sys.stderr if args.json == '-' else sys.stdout):
+        if args.suite in ('all', 'build'):
+            print("--- build_index benchmark (doubling corpus size should double the time) ---")
+            print_build_report(benchmark_build(args.sizes, args.repeat))
+
+        if args.suite in ('all', 'normalize'):
+            print("\n--- normalize_term benchmark ---")
+            print_normalization_report(benchmark_normalization())
+
+        if args.suite in ('all', 'retrieval'):
+            report = benchmark_retrieval(args.docs, args.queries, args.vocab, args.zipf, args.seed)
+
+    if args.suite in ('all', 'retrieval'):
+        if args.json == '-':
+            print(json.dumps(report, indent=2))
+        else:
+            print("\n--- Retrieval benchmark ---")
+            print_retrieval_report(report)
+            if args.json:
+                with open(args.json, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2)
+                print(f"Report saved to {args.json}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,385 @@
 import os
 import re
-import unicodedata
 import sys
+import heapq
+from bisect import bisect_left
+
+from indexing import load_index
+from postings import DocIdView
+from normalization import normalize_term, clean_text, load_stopwords
+from instrumentation import stage
 
 # Configuration Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 PROCESSED_DIR = os.path.join(BASE_DIR, 'processed')
 STOPWORDS_FILE = os.path.join(DATA_DIR, 'stopwords.txt')
+DEFAULT_NEAR = 5 # Distance of a NEAR without /k
+MAX_NESTING = 100 # Parentheses and NOTs inside each other (the parser is recursive)
 
-# Function for read the files
-def read_file(filepath):
-    try:
-        with open(filepath, 'r', encoding = 'utf-8') as f:
-            return f.read()
-    
-    except UnicodeDecodeError:
-        with open(filepath, 'r', encoding = 'iso-8859-1') as f:
-            return f.read()
+# Functions to merge sorted postings lists (doc ids)
+def gallop(postings, target, lo):
+    # Galloping search: first position >= lo whose doc id is >= target.
+    # The step doubles until the target is passed, then a binary search closes in.
+    n = len(postings)
+    step = 1
+    hi = lo
+    while hi < n and postings[hi] < target:
+        lo = hi + 1
+        hi = lo + step
+        step *= 2
+    return bisect_left(postings, target, lo, min(hi, n))
+
+def seek(postings, target, lo):
+    # Compressed postings skip whole blocks with the last doc id of each block;
+    # other lists (results of sub-expressions) are galloped
+    if isinstance(postings, DocIdView):
+        return postings.seek(target, lo)
+    return gallop(postings, target, lo)
+
+def intersect_postings(shorter, longer):
+    # Walks the shorter list and seeks through the longer one
+    result = []
+    pos = 0
+    n = len(longer)
+    for doc_id in shorter:
+        pos = seek(longer, doc_id, pos)
+        if pos == n:
+            break
+        if longer[pos] == doc_id:
+            result.append(doc_id)
+    return result
+
+def union_postings(lists):
+    result = []
+    for doc_id in heapq.merge(*lists):
+        if not result or result[-1] != doc_id:
+            result.append(doc_id)
+    return result
+
+def difference_postings(postings, excluded):
+    # Doc ids of 'postings' that are not in 'excluded'
+    result = []
+    pos = 0
+    n = len(excluded)
+    for doc_id in postings:
+        pos = seek(excluded, doc_id, pos)
+        if pos == n or excluded[pos] != doc_id:
+            result.append(doc_id)
+    return result
+
+def within(starts_a, length_a, starts_b, length_b, distance):
+    # True if a match of 'a' and a match of 'b' that do not overlap are at most 'distance'
+    # positions apart (in either order). For every start of 'a', the starts of 'b' that
+    # qualify form two ranges (before and after it), looked up by binary search.
+    for start in starts_a:
+        end = start + length_a - 1
+        pos = bisect_left(starts_b, start - distance - length_b + 1)
+        if pos < len(starts_b) and starts_b[pos] <= start - length_b:
+            return True
+        pos = bisect_left(starts_b, end + 1, pos)
+        if pos < len(starts_b) and starts_b[pos] <= end + distance:
+            return True
+    return False
+
+# Query plan: every node estimates its cardinality (from document frequencies,
+# without touching the postings) and evaluates to a sorted list of doc ids.
+# Terms and phrases also give the positions where they start in a document (starts),
+# read from the positional postings of the index.
+class TermNode:
+    length = 1
+
+    def __init__(self, term):
+        self.term = term
+
+    def estimate(self, index):
+        return len(index.doc_ids(self.term))
+
+    def evaluate(self, index):
+        return index.doc_ids(self.term)
+
+    def starts(self, index, doc_id):
+        return index.term_positions(self.term, doc_id)
+
+    def __str__(self):
+        return self.term
+
+class PhraseNode:
+    def __init__(self, terms):
+        self.terms = terms
+        self.length = len(terms)
+
+    def estimate(self, index):
+        return min(len(index.doc_ids(term)) for term in self.terms)
+
+    def starts(self, index, doc_id):
+        # Starts of the first term that the i-th term follows at +i (merge of the positions)
+        starts = index.term_positions(self.terms[0], doc_id)
+        for offset, term in enumerate(self.terms[1:], start=1):
+            if not starts:
+                break
+            shifted = [p - offset for p in index.term_positions(term, doc_id)]
+            if len(shifted) < len(starts):
+                starts = intersect_postings(shifted, starts)
+            else:
+                starts = intersect_postings(starts, shifted)
+        return starts
+
+    def evaluate(self, index):
+        # Documents with all the terms, then the positions are checked in each one
+        lists = sorted((index.doc_ids(term) for term in self.terms), key=len)
+        candidates = lists[0]
+        for postings in lists[1:]:
+            if not candidates:
+                return []
+            candidates = intersect_postings(candidates, postings)
+        return [doc_id for doc_id in candidates if self.starts(index, doc_id)]
+
+    def __str__(self):
+        return '"' + " ".join(self.terms) + '"'
+
+class NearNode:
+    def __init__(self, left, right, distance):
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def estimate(self, index):
+        return min(self.left.estimate(index), self.right.estimate(index))
+
+    def evaluate(self, index):
+        left = self.left.evaluate(index)
+        right = self.right.evaluate(index)
+        if len(right) < len(left):
+            left, right = right, left
+        return [doc_id for doc_id in intersect_postings(left, right)
+                if within(self.left.starts(index, doc_id), self.left.length,
+                          self.right.starts(index, doc_id), self.right.length, self.distance)]
+
+    def __str__(self):
+        return f"({self.left} NEAR/{self.distance} {self.right})"
+
+class NotNode:
+    def __init__(self, child):
+        self.child = child
+
+    def estimate(self, index):
+        return len(index.doc_map) - self.child.estimate(index)
+
+    def evaluate(self, index):
+        # A standalone NOT is the complement against the whole collection
+        return difference_postings(index.all_doc_ids(), self.child.evaluate(index))
+
+    def __str__(self):
+        return f"NOT {self.child}"
+
+class AndNode:
+    def __init__(self, children):
+        self.children = children
+
+    def estimate(self, index):
+        return min(child.estimate(index) for child in self.children)
+
+    def evaluate(self, index):
+        # Positive operands are intersected from the smallest estimate up, and the
+        # NOT operands are subtracted afterwards from the (already small) result.
+        positives = [c for c in self.children if not isinstance(c, NotNode)]
+        negatives = [c.child for c in self.children if isinstance(c, NotNode)]
+
+        if positives:
+            positives.sort(key=lambda c: c.estimate(index))
+            result = positives[0].evaluate(index)
+            for child in positives[1:]:
+                if not result:
+                    return []
+                postings = child.evaluate(index)
+                if len(postings) < len(result):
+                    result = intersect_postings(postings, result)
+                else:
+                    result = intersect_postings(result, postings)
+        else:
+            result = index.all_doc_ids()
+
+        negatives.sort(key=lambda c: c.estimate(index), reverse=True)
+        for child in negatives:
+            if not result:
+                return []
+            result = difference_postings(result, child.evaluate(index))
+
+        return list(result)
+
+    def __str__(self):
+        return "(" + " AND ".join(str(c) for c in self.children) + ")"
 
-# Function for normalize the terms
-def remove_accents(text):
-    nfkd_form = unicodedata.normalize('NFD', text)
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+class OrNode:
+    def __init__(self, children):
+        self.children = children
 
-def normalize_term(term):
-    term = term.lower().strip()
-    term = remove_accents(term)
-    term = re.sub(r'[^\w\s]', '', term)
-    return term
+    def estimate(self, index):
+        return min(len(index.doc_map), sum(child.estimate(index) for child in self.children))
+
+    def evaluate(self, index):
+        lists = [child.evaluate(index) for child in self.children]
+        return union_postings([postings for postings in lists if postings])
+
+    def __str__(self):
+        return "(" + " OR ".join(str(c) for c in self.children) + ")"
+
+# Query parser. Precedence: NEAR > NOT > AND > OR. Two operands without an operator are an AND.
+#   expr      := and_expr (OR and_expr)*
+#   and_expr  := not_expr ([AND] not_expr)*
+#   not_expr  := NOT not_expr | '(' expr ')' | near_expr
+#   near_expr := operand [NEAR[/k] operand]
+#   operand   := term | '"' phrase '"'
+# 'a NEAR/k b' matches when a and b (terms or phrases, in any order) are at most k
+# positions apart. Phrase words are cleaned like the documents: stop-words are dropped
+# from both, so "casa de papel" is the phrase "casa papel" and also matches "casa el papel".
+QUERY_TOKEN = re.compile(r'"[^"]*"?|\(|\)|[^\s()"]+')
+NEAR_OPERATOR = re.compile(r'NEAR(?:/(\d+))?$', re.IGNORECASE)
+OPERATORS = {'AND', 'OR', 'NOT'}
+_stopwords = None
+
+def phrase_terms(text):
+    global _stopwords
+    if _stopwords is None:
+        _stopwords = load_stopwords(STOPWORDS_FILE)
+    return clean_text(text, _stopwords)
+
+class QueryParser:
+    def __init__(self, raw_query):
+        self.tokens = QUERY_TOKEN.findall(raw_query)
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            if token.upper() in OPERATORS or NEAR_OPERATOR.match(token):
+                return token.upper()
+            return token
+        return None
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty query.")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected '{self.peek()}'.")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.next()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else OrNode(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() not in (None, 'OR', ')'):
+            if self.peek() == 'AND':
+                self.next()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else AndNode(children)
+
+    def parse_not(self):
+        token = self.next()
+        if token in ('NOT', '('):
+            # Deep nesting is rejected before it can exhaust the Python stack
+            self.depth += 1
+            if self.depth > MAX_NESTING:
+                raise ValueError(f"The query is nested too deeply (more than {MAX_NESTING} levels).")
+            if token == 'NOT':
+                node = NotNode(self.parse_not())
+            else:
+                node = self.parse_or()
+                if self.next() != ')':
+                    raise ValueError("Missing ')'.")
+            self.depth -= 1
+            return node
+        node = self.parse_operand(token)
+        if self.peek() is not None and NEAR_OPERATOR.match(self.peek()):
+            distance = NEAR_OPERATOR.match(self.next()).group(1)
+            node = NearNode(node, self.parse_operand(self.next()),
+                            int(distance) if distance else DEFAULT_NEAR)
+            if self.peek() is not None and NEAR_OPERATOR.match(self.peek()):
+                raise ValueError("NEAR joins two terms or phrases (use AND between NEARs).")
+        return node
+
+    def parse_operand(self, token):
+        if token is None or token in OPERATORS or token == ')' or token == '(' or NEAR_OPERATOR.match(token):
+            raise ValueError(f"Expected a term, found '{token or 'end of query'}'.")
+
+        if token.startswith('"'):
+            if len(token) < 2 or not token.endswith('"'):
+                raise ValueError("Missing closing '\"'.")
+            terms = phrase_terms(token[1:-1])
+            if not terms:
+                raise ValueError(f"{token} has no indexable words.")
+            return TermNode(terms[0]) if len(terms) == 1 else PhraseNode(terms)
+
+        term = normalize_term(token)
+        if not term:
+            raise ValueError(f"'{token}' is not a valid term.")
+        return TermNode(term)
+
+# Function to compile a query into a plan, flattening nested operators of the same kind
+def compile_query(raw_query):
+    with stage('boolean.parse'):
+        return simplify(QueryParser(raw_query).parse())
+
+def simplify(node):
+    if isinstance(node, NotNode):
+        child = simplify(node.child)
+        # NOT NOT a == a
+        return child.child if isinstance(child, NotNode) else NotNode(child)
+
+    if isinstance(node, (AndNode, OrNode)):
+        children = []
+        for child in map(simplify, node.children):
+            if type(child) is type(node):
+                children.extend(child.children)
+            else:
+                children.append(child)
+        return type(node)(children)
+
+    return node
 
 # Function that resolve the query
-def resolve_query():
+def resolve_query(index):
     print("\n--- Boolean Model Query Resolution ---")
-    print("Formats allowed: 'term1 AND term2', 'term1 OR term2'")
+    print("Operators allowed: AND, OR, NOT and parentheses, e.g. '(term1 OR term2) AND NOT term3'")
+    print("Phrases and proximity: '\"term1 term2\"', 'term1 NEAR/3 term2' (at most 3 words apart)")
+    print("Stop-words are ignored inside phrases: '\"casa de papel\"' matches 'casa papel'")
     raw_query = input("Write your query: ").strip()
     
     if not raw_query:
         print("Empty query.")
         return
 
-    # 1. Parse the query to find the operator and terms
-    # We assume simple queries: "A AND B" or "A OR B"
-    parts = raw_query.split()
-    
-    operator = None
-    terms = []
-
-    # Detect operator (case insensitive)
-    if "AND" in [p.upper() for p in parts]:
-        operator = "AND"
-        # Split by the word AND/and
-        temp_terms = re.split(r'\s+AND\s+|\s+and\s+', raw_query)
-
-    elif "OR" in [p.upper() for p in parts]:
-        operator = "OR"
-        temp_terms = re.split(r'\s+OR\s+|\s+or\s+', raw_query)
-
-    else:
-        print("No operator in the query.")
-        return
-
-    # 2. Normalize query terms to match .rep format
-    # We filter out empty strings in case of extra spaces
-    terms = [normalize_term(t) for t in temp_terms if t.strip()]
-    
-    if not terms:
-        print("Invalid query terms.")
+    # 1. Parse the query (terms are normalized to match the .rep format)
+    try:
+        plan = compile_query(raw_query)
+    except ValueError as e:
+        print(f"Invalid query: {e}")
         return
 
-    print(f"Searching for: {terms} with logic: {operator}")
+    print(f"Searching for: {plan}")
 
-    # 3. Iterate through all .rep files
-    if not os.path.exists(PROCESSED_DIR):
-        print(f"Error: {PROCESSED_DIR} does not exist.")
+    # 2. Evaluate the plan over the postings lists of the inverted index
+    try:
+        with stage('boolean.evaluate'):
+            matches = [index.doc_map[doc_id] for doc_id in plan.evaluate(index)]
+    except ValueError as e:
+        print(f"The query could not be resolved: {e}")
         return
 
-    files = [f for f in os.listdir(PROCESSED_DIR) if f.endswith('.rep')]
-    matches = []
-
-    for filename in files:
-        filepath = os.path.join(PROCESSED_DIR, filename)
-        content = read_file(filepath)
-        
-        # Create a SET of words from the document for O(1) lookup speed
-        # The .rep file has terms separated by newlines or spaces
-        doc_terms = set(content.split())
-        
-        is_match = False
-        
-        # 4. Check logic
-        if operator == "AND":
-            # ALL terms must be in the document
-            # We use Python's set capability: is the set of query terms a subset of doc terms?
-            if set(terms).issubset(doc_terms):
-                is_match = True
-                
-        elif operator == "OR":
-            # AT LEAST ONE term must be in the document
-            # Intersection of sets must not be empty
-            if not doc_terms.isdisjoint(set(terms)):
-                is_match = True
-
-        if is_match:
-            # We store the original .txt name usually, or the .rep name
-            matches.append(filename)
-
-    # 5. Output results
+    # 3. Output results
     if matches:
         print(f"\nQuery found in {len(matches)} documents:")
         for m in matches:
@@ -116,6 +389,10 @@ def resolve_query():
 
 # Function for main
 def main():
+    index = load_index()
+    if not index.is_built:
+        return
+
     while True:
         print("\n=== BOOLEAN MODEL MENU ===")
         print("a) Query resolve")
@@ -124,9 +401,13 @@ def main():
         choice = input("Select an option: ").lower().strip()
 
         if choice == 'a':
-            resolve_query()
+            resolve_query(index)
         
         elif choice == 'b':
+            # Only an index loaded from a segment is closed; the one built from the
+            # corpus is shared with the other models and stays open
+            if index.segment is not None:
+                index.close_segment()
             print("Exiting...")
             break
 
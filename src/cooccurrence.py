@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from indexing import load_index
+from normalization import normalize_term
+
+# Configuration Paths
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSED_DIR = os.path.join(BASE_DIR, 'processed')
+COOCCURRENCE_FILE = os.path.join(PROCESSED_DIR, 'cooccurrence.json')
+
+# Expansion parameters
+MIN_ASSOCIATION = 0.05 # Associations below this value are not stored
+NEIGHBOURS = 10 # Neighbours kept per term
+EXPANSION_TERMS = 3 # Neighbours added per query term
+SHARD_SIZE = 512 # Terms per task when the matrix is built in parallel
+
+# Normalized association matrix:
+#   c_uv = sum_d f_u,d * f_v,d   (M x M^T, with M the term x document frequency matrix)
+#   s_uv = c_uv / (c_uu + c_vv - c_uv)
+# c_uv is only non-zero when u and v share a document, so each row is computed from the
+# postings of u and the terms of its documents, never as a dense V x V matrix.
+# Only the best NEIGHBOURS entries of each row above MIN_ASSOCIATION are kept.
+
+# Function to read the term x document matrix from the postings of the index.
+# Returns the postings [(doc ids, tfs)] and the forward index {doc: (term numbers, tfs)}.
+def term_document_matrix(index):
+    postings = []
+    docs = defaultdict(lambda: (array('I'), array('I')))
+
+    for t in range(len(index.vocab_list)):
+        doc_ids, tfs = array('I'), array('I')
+        for doc, tf in index.store.postings(t).items():
+            doc_ids.append(doc)
+            tfs.append(tf)
+            terms, freqs = docs[doc]
+            terms.append(t)
+            freqs.append(tf)
+        postings.append((doc_ids, tfs))
+
+    return postings, dict(docs)
+
+def association_row(u, postings, docs, self_products, min_association, n):
+    # Best n (term number, s_uv) of row u
+    row = defaultdict(int)
+    for doc, f_u in zip(*postings[u]):
+        terms, freqs = docs[doc]
+        for v, f_v in zip(terms, freqs):
+            row[v] += f_u * f_v
+
+    c_uu = self_products[u]
+    scores = []
+    for v, c_uv in row.items():
+        if v != u:
+            s_uv = c_uv / (c_uu + self_products[v] - c_uv)
+            if s_uv >= min_association:
+                scores.append((v, s_uv))
+
+    return heapq.nsmallest(n, scores, key=lambda x: (-x[1], x[0]))
+
+def _init_worker(postings, docs, self_products, min_association, n):
+    # The matrix is sent once per worker process, not once per shard
+    global _worker_args
+    _worker_args = (postings, docs, self_products, min_association, n)
+
+def _association_shard(start, end):
+    return start, [association_row(u, *_worker_args) for u in range(start, end)]
+
+class CooccurrenceMatrix:
+    def __init__(self):
+        self.neighbours = {} # {term: [(neighbour, s_uv)]}, best first
+
+    def build(self, index, workers=1, min_association=MIN_ASSOCIATION, n=NEIGHBOURS):
+        start = time.perf_counter()
+        vocab = list(index.vocab_list)
+        postings, docs = term_document_matrix(index)
+        self_products = [sum(tf * tf for tf in tfs) for _, tfs in postings]
+        args = (postings, docs, self_products, min_association, n)
+
+        rows = [None] * len(vocab)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=args) as pool:
+                shards = [pool.submit(_association_shard, lo, min(lo + SHARD_SIZE, len(vocab)))
+                          for lo in range(0, len(vocab), SHARD_SIZE)]
+                for future in shards:
+                    lo, shard_rows = future.result()
+                    rows[lo:lo + len(shard_rows)] = shard_rows
+        else:
+            rows = [association_row(u, *args) for u in range(len(vocab))]
+
+        self.neighbours = {}
+        for u, row in enumerate(rows):
+            if row:
+                self.neighbours[vocab[u]] = [(vocab[v], s_uv) for v, s_uv in row]
+
+        n_entries = sum(len(row) for row in self.neighbours.values())
+        print(f"Co-occurrence matrix built: {len(vocab)} terms, {n_entries} associations "
+              f"({time.perf_counter() - start:.2f} s).")
+
+    def save(self, path=COOCCURRENCE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'neighbours': self.neighbours}, f)
+        os.replace(tmp_path, path)
+        print(f"Co-occurrence matrix saved to {path}.")
+
+    def load(self, path=COOCCURRENCE_FILE):
+        if not os.path.exists(path):
+            print(f"Error: No saved co-occurrence matrix at {path}. Build and save it first.")
+            return False
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            neighbours = {term: [(neighbour, float(s_uv)) for neighbour, s_uv in row]
+                          for term, row in data['neighbours'].items()}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Error: {path} is not a valid co-occurrence matrix ({e!r}).")
+            return False
+
+        self.neighbours = neighbours
+        print(f"Co-occurrence matrix loaded from {path} ({len(self.neighbours)} terms).")
+        return True
+
+    def expand(self, terms, n=EXPANSION_TERMS):
+        # Query terms followed by the best n neighbours of each one (without repetitions)
+        expanded = list(dict.fromkeys(terms))
+        seen = set(expanded)
+        for term in list(expanded):
+            for neighbour, _ in self.neighbours.get(term, ())[:n]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    expanded.append(neighbour)
+        return expanded
+
+# Functions for the menu
+def show_neighbours(matrix):
+    term = normalize_term(input("\nEnter a term: "))
+    row = matrix.neighbours.get(term)
+    if not row:
+        print(f"The term '{term}' has no associated terms.")
+        return
+
+    print(f"\n--- Terms associated with '{term}' ---")
+    for neighbour, s_uv in row:
+        print(f"  -> {neighbour:<20} {s_uv:.4f}")
+
+def expand_query(matrix):
+    raw_query = input("\nInsert the query: ")
+    terms = [t for t in (normalize_term(w) for w in raw_query.split()) if t]
+    if not terms:
+        print("Empty query.")
+        return
+
+    start = time.perf_counter()
+    expanded = matrix.expand(terms)
+    elapsed = (time.perf_counter() - start) * 1e6
+    print(f"Expanded query: {' '.join(expanded)} ({elapsed:.1f} us)")
+
+def print_menu():
+    print("\n=== CO-OCCURRENCE QUERY EXPANSION ===")
+    print("a) Build the co-occurrence matrix (from the inverted index)")
+    print("b) Save the matrix to disk")
+    print("c) Load the matrix from disk")
+    print("d) Show the terms associated with a term")
+    print("e) Expand a query")
+    print("f) Exit")
+
+def main():
+    matrix = CooccurrenceMatrix()
+
+    while True:
+        print_menu()
+        choice = input("Choose an option: ").strip().lower()
+
+        if choice == 'a':
+            index = load_index()
+            if index.is_built:
+                matrix.build(index)
+                index.close_segment()
+
+        elif choice == 'b':
+            matrix.save()
+
+        elif choice == 'c':
+            matrix.load()
+
+        elif choice == 'd':
+            show_neighbours(matrix)
+
+        elif choice == 'e':
+            expand_query(matrix)
+
+        elif choice == 'f':
+            print("Exiting...")
+            break
+
+        else:
+            print("Invalid option.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Co-occurrence query expansion (interactive menu by default).")
+    parser.add_argument('--build', action='store_true',
+                        help="Build the matrix from the inverted index and save it, without the menu.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for the build (vocabulary shards).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.build:
+        index = load_index()
+        if not index.is_built:
+            sys.exit(1)
+        matrix = CooccurrenceMatrix()
+        matrix.build(index, workers=args.workers)
+        index.close_segment()
+        matrix.save()
+    else:
+        main()
@@ -0,0 +1,135 @@
+import os
+from array import array
+from collections import Counter
+
+from instrumentation import stage, count
+from terms import TermDictionary, TermMap
+
+# Configuration Paths
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSED_DIR = os.path.join(BASE_DIR, 'processed')
+
+# Shared statistics of the normalized collection (processed/*.rep).
+# The collection is read once and kept for the whole process: main.py runs the models
+# one after another in the same process, and this module (unlike the scripts run with
+# runpy) is imported only once, so switching models reuses the same Corpus.
+# It is read again only when a .rep file is added, changed or deleted.
+_cache = None
+
+# Function to count the terms of a .rep file, read line by line
+def count_terms(filepath):
+    for encoding in ('utf-8', 'iso-8859-1'):
+        counts = Counter()
+        try:
+            with open(filepath, 'r', encoding=encoding) as f:
+                for line in f:
+                    counts.update(line.split())
+            return counts
+        except UnicodeDecodeError:
+            continue
+
+# Function to read a whole text file (utf-8, or iso-8859-1 when it is not valid utf-8)
+def read_file(filepath):
+    for encoding in ('utf-8', 'iso-8859-1'):
+        try:
+            with open(filepath, 'r', encoding=encoding) as f:
+                return f.read()
+        except UnicodeDecodeError:
+            continue
+
+# Function to read a whole document (e.g. to show it)
+def read_document(filename, directory=PROCESSED_DIR):
+    return read_file(os.path.join(directory, filename))
+
+# Function to list the files of a directory with an extension, sorted by name
+def list_files(directory, extension):
+    if not os.path.exists(directory):
+        return []
+    return sorted([f for f in os.listdir(directory) if f.endswith(extension)])
+
+# Function to describe the collection as it is on disk: ((filename, size, mtime_ns), ...)
+def collection_signature(directory=PROCESSED_DIR):
+    if not os.path.exists(directory):
+        return ()
+
+    signature = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.rep'):
+            st = os.stat(os.path.join(directory, filename))
+            signature.append((filename, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+class Corpus:
+    """
+    Term statistics of the collection. Documents are numbered by sorted file name and
+    terms by their id in the term dictionary (sorted vocabulary, see terms.py); every
+    per-term structure is a list or array indexed by term id.
+    """
+    def __init__(self, signature, directory=PROCESSED_DIR):
+        self.signature = signature
+        self.doc_names = [filename for filename, _, _ in signature] # doc number -> filename
+        self.doc_numbers = {filename: doc for doc, filename in enumerate(self.doc_names)}
+        self.terms = TermDictionary.from_sorted([]) # term <-> term id
+        self.tf = [] # doc number -> (term ids, tfs), sorted by term id
+        self.doc_lengths = array('I') # doc number -> number of terms
+        self.postings = [] # term id -> sorted doc numbers, DF = length of the list
+        self.cf = array('Q') # term id -> collection frequency
+        self.derived = {} # Structures that the models build from this corpus, see cached()
+
+        counts_list = []
+        vocabulary = set()
+        for filename in self.doc_names:
+            with stage('corpus.read_file'):
+                counts = count_terms(os.path.join(directory, filename))
+            count('corpus.documents')
+            counts_list.append(counts)
+            vocabulary.update(counts)
+
+        self.terms = TermDictionary.from_sorted(sorted(vocabulary))
+        term_ids = {term: t for t, term in enumerate(self.terms)} # Only while the arrays are built
+        self.postings = [array('I') for _ in range(len(self.terms))]
+        self.cf = array('Q', bytes(len(self.terms) * 8))
+
+        for doc, counts in enumerate(counts_list):
+            terms = sorted(counts)
+            doc_terms = array('I', (term_ids[term] for term in terms))
+            doc_tfs = array('I', (counts[term] for term in terms))
+            self.tf.append((doc_terms, doc_tfs))
+            self.doc_lengths.append(sum(doc_tfs))
+            for t, tf in zip(doc_terms, doc_tfs):
+                self.postings[t].append(doc)
+                self.cf[t] += tf
+            counts_list[doc] = None
+
+    def __len__(self):
+        return len(self.doc_names)
+
+    def df(self, term):
+        t = self.terms.find(term)
+        return len(self.postings[t]) if t >= 0 else 0
+
+    def term_postings(self):
+        # {term: sorted doc numbers} view over the postings arrays
+        return TermMap(self.terms, self.postings)
+
+    def cached(self, key, factory):
+        # Builds a structure derived from the corpus once (e.g. the weights of a model);
+        # it is dropped with the corpus when the collection changes.
+        if key not in self.derived:
+            self.derived[key] = factory()
+        return self.derived[key]
+
+    def documents(self):
+        # (filename, Counter, (size, mtime_ns)) of every document, as read by the index builder
+        vocabulary = list(self.terms)
+        for (filename, size, mtime_ns), (doc_terms, doc_tfs) in zip(self.signature, self.tf):
+            counts = Counter({vocabulary[t]: tf for t, tf in zip(doc_terms, doc_tfs)})
+            yield filename, counts, (size, mtime_ns)
+
+# Function to get the shared corpus (read only the first time, or when the files changed)
+def get_corpus():
+    global _cache
+    signature = collection_signature()
+    if _cache is None or _cache.signature != signature:
+        _cache = Corpus(signature)
+    return _cache
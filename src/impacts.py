@@ -0,0 +1,196 @@
+import os
+import math
+import time
+import heapq
+import runpy
+import argparse
+from array import array
+from collections import defaultdict
+
+from corpus import get_corpus
+from ranking import top_k
+from instrumentation import stage, count
+from terms import TermDictionary
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Impact-ordered layout of the vector model, for ranked queries evaluated score-at-a-time.
+#
+# The postings are those of the VSM (vector-model.py): same tokenizer, weights tf-idf / |d|.
+# Every weight is quantized to an impact in 1..IMPACT_LEVELS (one impact unit is the largest
+# weight / IMPACT_LEVELS) and the postings of a term are grouped by impact, highest first:
+# [(impact, doc numbers, weights, largest weight), ...], in a list indexed by the term ids of
+# the VSM dictionary. The impacts only order the postings; the exact weights are summed, so
+# a complete evaluation gives the cosine scores of SearchEngine.search.
+# A query sorts the segments of all its terms by contribution (query weight * largest weight
+# of the segment, the query weight being tf * idf) and adds them to the accumulators in that
+# order, so the most important postings are read first.
+# Under a time budget the evaluation can stop between segments (or inside a long one); the
+# answer then reports a bound: the most that any document could still gain.
+# The budget covers the scoring; the final top-k selection (linear in the number of
+# accumulators) comes on top of it.
+IMPACT_LEVELS = 255
+DEFAULT_BUDGET_MS = 20.0
+BUDGET_CHECK = 1024 # Postings added between two checks of the deadline
+
+class ImpactIndex:
+    def __init__(self, doc_names, levels=IMPACT_LEVELS):
+        self.doc_names = doc_names # doc number -> filename
+        self.levels = levels
+        self.terms = TermDictionary.from_sorted([]) # term <-> term id
+        self.segments = [] # term id -> [(impact, doc numbers, weights, largest weight)], highest impact first
+
+    @classmethod
+    def from_engine(cls, engine, levels=IMPACT_LEVELS):
+        # Segments from the normalized postings of a loaded SearchEngine
+        impact_index = cls(engine.doc_names, levels)
+        impact_index.terms = engine.vocab
+        top = max(engine.max_weights, default=0.0)
+        unit = top / levels if top > 0 else 1.0
+
+        for postings in engine.postings:
+            # None: every weight of the term is zero, it can not change any ranking
+            if postings is None:
+                impact_index.segments.append([])
+                continue
+            groups = defaultdict(lambda: (array('I'), array('d')))
+            for doc, weight in zip(*postings):
+                doc_numbers, weights = groups[max(1, round(weight / unit))]
+                doc_numbers.append(doc)
+                weights.append(weight)
+            # Rounding keeps the order of the weights: a lower impact only has smaller weights
+            impact_index.segments.append([(impact, doc_numbers, weights, max(weights))
+                                          for impact, (doc_numbers, weights) in sorted(groups.items(), reverse=True)])
+
+        return impact_index
+
+    def search(self, query_vec, k=10, budget_ms=None):
+        """
+        Score-at-a-time evaluation of a VSM query vector ({term: tf * idf}, see
+        SearchEngine.get_query_vector). Returns (results, info): results are the top-k
+        (filename, cosine) and info tells whether every posting was read ('complete'),
+        the bound on what any document could still gain ('bound'), and whether the
+        top-k documents are known to be the same as with a complete evaluation ('safe';
+        their order may still change). A complete evaluation returns the same ranking as
+        SearchEngine.search(query_vec, k); when the evaluation stopped early the scores
+        are lower bounds, and the final score of a document is at most score + bound.
+        """
+        start = time.perf_counter()
+        deadline = start + budget_ms / 1000 if budget_ms is not None else None
+
+        norm_q = math.sqrt(sum(w ** 2 for w in query_vec.values()))
+        segments = []
+        for term, q_weight in query_vec.items():
+            t = self.terms.find(term)
+            if q_weight == 0 or t < 0:
+                continue
+            segments.extend((q_weight * top, q_weight, term, docs, weights)
+                            for _, docs, weights, top in self.segments[t])
+        segments.sort(key=lambda segment: -segment[0])
+
+        accumulators = defaultdict(float)
+        stopped_at = len(segments)
+        postings = 0
+
+        with stage('impact.score'):
+            for i, (_, q_weight, _, docs, weights) in enumerate(segments):
+                position = 0
+                while position < len(docs):
+                    if deadline is not None and time.perf_counter() >= deadline:
+                        break
+                    end = position + BUDGET_CHECK
+                    for doc, d_weight in zip(docs[position:end], weights[position:end]):
+                        accumulators[doc] += q_weight * d_weight
+                    position = end
+                postings += min(position, len(docs))
+                if position < len(docs):
+                    stopped_at = i
+                    break
+
+        # A document gains at most one segment per term: the first one not (fully) read
+        remaining = {}
+        for contribution, _, term, _, _ in segments[stopped_at:]:
+            remaining.setdefault(term, contribution)
+        bound = sum(remaining.values())
+
+        # The threshold is found on the bare values (no key function), then only the
+        # documents that reach it are ranked
+        values = heapq.nlargest(k + 1, accumulators.values())
+        threshold = values[-1] if values else 0.0
+        best = top_k([(doc, acc) for doc, acc in accumulators.items() if acc >= threshold], k + 1)
+        # Safe when nothing is left, or when no document outside the top-k can catch up
+        if not remaining:
+            safe = True
+        else:
+            kth = best[k - 1][1] if len(best) >= k else 0.0
+            runner_up = best[k][1] if len(best) > k else 0.0
+            safe = len(best) >= k and kth >= runner_up + bound and kth >= bound
+
+        count('impact.postings_read', postings)
+        info = {
+            'complete': not remaining,
+            'safe': safe,
+            'bound': bound / norm_q if norm_q else 0.0,
+            'segments_read': stopped_at,
+            'segments': len(segments),
+            'postings_read': postings,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+        results = [(self.doc_names[doc], acc / norm_q) for doc, acc in best[:k]]
+        return results, info
+
+# Function to get the VSM engine of the shared corpus (vector-model.py has a dash in its
+# name, so it is run as a script; the engine is cached with the corpus like in its menu)
+def load_engine():
+    vector = runpy.run_path(os.path.join(SRC_DIR, 'vector-model.py'), run_name='impacts')
+    return get_corpus().cached('vector-model', vector['load_engine'])
+
+# Function to resolve a query with a latency budget
+def resolve_query(engine, impact_index, k=10, budget_ms=DEFAULT_BUDGET_MS):
+    query_vec = engine.get_query_vector(input("\nInsert the query: "))
+    if not query_vec:
+        print("Empty query.")
+        return
+
+    results, info = impact_index.search(query_vec, k, budget_ms)
+    if not results:
+        print("No documents matched your query.")
+    for i, (doc, score) in enumerate(results):
+        print(f"[{i+1}] {doc} (Sim: {score:.4f})")
+
+    state = "complete" if info['complete'] else f"stopped by the budget, bound {info['bound']:.4f}"
+    print(f"({info['segments_read']}/{info['segments']} segments, {info['postings_read']} postings, "
+          f"{info['elapsed_ms']} ms, {state}, top-k {'safe' if info['safe'] else 'approximate'})")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ranked queries over impact-ordered postings.")
+    parser.add_argument('--query', help="Resolve one query and exit (default: ask for queries).")
+    parser.add_argument('--k', type=int, default=10, help="Number of results.")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="Time budget per query in milliseconds (0: no budget).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    budget_ms = args.budget_ms or None
+    engine = load_engine()
+    if not engine.doc_names:
+        return
+
+    impact_index = ImpactIndex.from_engine(engine)
+    print(f"Impact index ready: {len(impact_index.terms)} terms, {impact_index.levels} impact levels.")
+
+    if args.query is not None:
+        results, info = impact_index.search(engine.get_query_vector(args.query), args.k, budget_ms)
+        for doc, score in results:
+            print(f"{doc}\t{score:.6f}")
+        print(info)
+        return
+
+    while True:
+        resolve_query(engine, impact_index, args.k, budget_ms)
+        if input("\nAnother query? (y/n): ").strip().lower() != 'y':
+            break
+
+if __name__ == "__main__":
+    main()
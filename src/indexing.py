@@ -1,30 +1,269 @@
 import os
 import math
 import sys
-from collections import defaultdict, Counter
+import mmap
+import struct
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+
+from postings import PostingsBuilder, PostingsStore
+from positions import PositionsBuilder, encode_positions, read_positions
+from terms import TermDictionary, BLOCK_TERMS
+from corpus import count_terms, get_corpus, collection_signature
+from instrumentation import stage, count
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PROCESSED_DIR = os.path.join(BASE_DIR, 'processed')
+INDEX_FILE = os.path.join(PROCESSED_DIR, 'index.seg')
+
+# Binary segment layout (all arrays in native byte order, 8-byte aligned):
+#   header | doc ids | doc sizes | doc mtimes | doc name offsets | doc names |
+#   term block offsets | terms (sorted, front-coded utf-8) |
+#   term idfs | term dfs | term first blocks | block last doc ids | block offsets | block widths | postings data
+# Doc sizes and mtimes are those of the .rep files, used to update the index incrementally.
+# The postings sections are the compressed PostingsStore arrays (see postings.py),
+# and the terms those of the TermDictionary (see terms.py).
+SEGMENT_PREFIX = b'IRSEG\x00\x00'
+SEGMENT_VERSION = 4
+SEGMENT_MAGIC = SEGMENT_PREFIX + bytes([SEGMENT_VERSION])
+SECTION_COUNT = 14
+SEGMENT_HEADER = struct.Struct(f'<8s1s7xIIQ{SECTION_COUNT}Q')
+
+def _align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+class SegmentDocMap(Mapping):
+    # Read-only {doc_id: filename} view over the segment
+    def __init__(self, segment):
+        self._segment = segment
+
+    def __len__(self):
+        return self._segment.n_docs
+
+    def __iter__(self):
+        return iter(self._segment.doc_ids)
+
+    def __getitem__(self, doc_id):
+        pos = self._segment.find_doc(doc_id)
+        if pos < 0:
+            raise KeyError(doc_id)
+        return self._segment.doc_name(pos)
+
+class PostingsMap(Mapping):
+    # {term: CompressedPostings} over a TermDictionary and a PostingsStore (in-memory index)
+    def __init__(self, terms, store):
+        self.terms = terms
+        self.store = store
+
+    def __getitem__(self, term):
+        idx = self.terms.find(term)
+        if idx < 0:
+            raise KeyError(term)
+        return self.store.postings(idx)
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+class IndexSegment(Mapping):
+    """
+    Memory-mapped, read-only inverted index segment ({term: CompressedPostings}).
+    Nothing is copied on open; pages are loaded by the OS when a term is looked up.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Empty or invalid segment file: {path}")
+
+        if len(self._mmap) < SEGMENT_HEADER.size:
+            self.close()
+            raise ValueError(f"Truncated segment file: {path}")
+
+        fields = SEGMENT_HEADER.unpack_from(self._mmap, 0)
+        magic, byteorder, self.n_docs, self.n_terms, self.n_postings = fields[:5]
+        offsets = fields[5:]
+
+        if magic[:len(SEGMENT_PREFIX)] != SEGMENT_PREFIX:
+            self.close()
+            raise ValueError(f"Not an index segment: {path}")
+        if magic != SEGMENT_MAGIC:
+            self.close()
+            raise ValueError(f"Unsupported segment version {magic[-1]} (expected {SEGMENT_VERSION}). Rebuild the index.")
+        if byteorder != sys.byteorder[0].encode():
+            self.close()
+            raise ValueError("The segment was written on a machine with a different byte order.")
+
+        self._views = []
+        self.doc_ids = self._view(offsets[0], self.n_docs, 'I')
+        self.doc_sizes = self._view(offsets[1], self.n_docs, 'Q')
+        self.doc_mtimes = self._view(offsets[2], self.n_docs, 'Q')
+        self._doc_name_offsets = self._view(offsets[3], self.n_docs + 1, 'Q')
+        self._doc_names_start = offsets[4]
+        term_offsets = self._view(offsets[5], -(-self.n_terms // BLOCK_TERMS) + 1, 'Q')
+        self.terms = TermDictionary(self.n_terms, term_offsets,
+                                    self._view(offsets[6], term_offsets[-1], 'B'))
+
+        idfs = self._view(offsets[7], self.n_terms, 'd')
+        dfs = self._view(offsets[8], self.n_terms, 'I')
+        term_blocks = self._view(offsets[9], self.n_terms + 1, 'Q')
+        n_blocks = term_blocks[-1]
+        last_docs = self._view(offsets[10], n_blocks, 'I')
+        block_offsets = self._view(offsets[11], n_blocks + 1, 'Q')
+        widths = self._view(offsets[12], n_blocks, 'B')
+        data = self._view(offsets[13], block_offsets[-1], 'B')
+        self.store = PostingsStore(idfs, dfs, term_blocks, last_docs, block_offsets, widths, data)
+
+        self.doc_map = SegmentDocMap(self)
+
+    def _view(self, offset, count, typecode):
+        size = count * array(typecode).itemsize
+        if offset + size > len(self._mmap):
+            self.close()
+            raise ValueError(f"Truncated segment file: {self.path}")
+        view = memoryview(self._mmap)[offset:offset + size].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def term(self, idx):
+        return self.terms[idx]
+
+    def find(self, term):
+        # Binary search over the front-coded term dictionary
+        return self.terms.find(term)
+
+    def find_doc(self, doc_id):
+        lo, hi = 0, self.n_docs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.doc_ids[mid] < doc_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_docs and self.doc_ids[lo] == doc_id:
+            return lo
+        return -1
+
+    def doc_name(self, pos):
+        start = self._doc_names_start + self._doc_name_offsets[pos]
+        end = self._doc_names_start + self._doc_name_offsets[pos + 1]
+        return self._mmap[start:end].decode('utf-8')
+
+    def postings(self, idx):
+        # Compressed postings read straight from the mapped file, decoded block by block
+        return self.store.postings(idx)
+
+    def __getitem__(self, term):
+        idx = self.find(term)
+        if idx < 0:
+            raise KeyError(term)
+        return self.postings(idx)
+
+    def __contains__(self, term):
+        return isinstance(term, str) and self.find(term) >= 0
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return self.n_terms
+
+    def close(self):
+        for view in getattr(self, '_views', []):
+            view.release()
+        self._views = []
+        self.store = None
+        if getattr(self, '_mmap', None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A postings view is still referenced somewhere: the map is freed with it
+                pass
+            self._mmap = None
+        self._file.close()
+
+def write_segment(path, index):
+    """Writes an InvertedIndex to 'path' as a binary segment (atomically, through a temp file)."""
+    doc_ids = array('I', sorted(index.doc_map))
+    doc_sizes = array('Q')
+    doc_mtimes = array('Q')
+    doc_name_offsets = array('Q', [0])
+    doc_names = bytearray()
+    for doc_id in doc_ids:
+        size, mtime_ns = index.doc_stat(doc_id)
+        doc_sizes.append(size)
+        doc_mtimes.append(mtime_ns)
+        doc_names += index.doc_map[doc_id].encode('utf-8')
+        doc_name_offsets.append(len(doc_names))
+
+    # The vocabulary is sorted, and so are the term numbers of the postings store
+    terms = index.vocab_list
+    store = index.store
+    sections = [doc_ids, doc_sizes, doc_mtimes, doc_name_offsets, bytes(doc_names),
+                terms.offsets, terms.data,
+                store.idfs, store.dfs, store.term_blocks, store.last_docs,
+                store.offsets, store.widths, store.data]
+
+    offsets = []
+    position = SEGMENT_HEADER.size
+    for section in sections:
+        position = _align(position)
+        offsets.append(position)
+        position += memoryview(section).nbytes
+
+    n_postings = sum(store.dfs)
+    header = SEGMENT_HEADER.pack(SEGMENT_MAGIC, sys.byteorder[0].encode(),
+                                 len(doc_ids), len(terms), n_postings, *offsets)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for offset, section in zip(offsets, sections):
+            f.write(b'\x00' * (offset - f.tell()))
+            f.write(section)
+
+    # The old segment may still be mapped by a reader, so never write over it in place
+    os.replace(tmp_path, path)
+    return position
 
 class InvertedIndex:
     def __init__(self):
-        self.index = defaultdict(list)
+        # {term: CompressedPostings}, iterating a postings list yields (doc_id, weight)
+        self.index = {}
         
         # Mapping de IDs
         self.doc_map = {}
         
-        self.vocab_list = []
+        # Term dictionary (TermDictionary once built): term <-> term number
+        self.vocab_list = TermDictionary.from_sorted([])
+
+        # Compressed postings of every term (term number = position in vocab_list)
+        self.store = PostingsBuilder().store()
+
+        # {doc_id: (size, mtime_ns)} of the .rep files, to detect changes
+        self.doc_stats = {}
         
         # State of the system
         self.is_built = False
 
-    def load_content(self, filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            with open(filepath, 'r', encoding='iso-8859-1') as f:
-                return f.read()
+        # Open segment when the index was loaded from disk
+        self.segment = None
+
+        # Positional postings (see positions.py), built on first use from the .rep files
+        self.positions = None
+
+        # Why the positional postings could not be built (kept so that the next phrase
+        # query does not read every .rep file again)
+        self.positions_error = None
 
     def build_index(self):
         if not os.path.exists(PROCESSED_DIR):
@@ -38,51 +277,271 @@ class InvertedIndex:
             return
 
         print(f"Proccesing {len(files)} documents...")
-        
-        self.index = defaultdict(list)
-        self.doc_map = {}
 
-        doc_freqs = defaultdict(int) # DF
-        doc_term_counts = {} # TF
-        all_terms = set()
-        N = len(files) # Total of documents
+        # 2. Stream the documents into the postings builder
+        self.build_from_counts(self.read_counts(files))
+        print("Index built successfully.")
 
-        # 2. TFs y DFs
-        for idx, filename in enumerate(files):
-            doc_id = idx + 1 
-            self.doc_map[doc_id] = filename
-            
+    def read_counts(self, files):
+        # Yields (filename, Counter, (size, mtime_ns)) for .rep files of PROCESSED_DIR,
+        # each file read line by line (it is never loaded whole)
+        for filename in files:
             filepath = os.path.join(PROCESSED_DIR, filename)
-            content = self.load_content(filepath)
-            
-            tokens = content.split()
-            
-            counts = Counter(tokens)
-            doc_term_counts[doc_id] = counts
-            
-            for term in counts:
-                doc_freqs[term] += 1
-                all_terms.add(term)
+            st = os.stat(filepath)
+            yield filename, count_terms(filepath), (st.st_size, st.st_mtime_ns)
 
-        self.vocab_list = sorted(list(all_terms))
+    def build_from_counts(self, documents):
+        """
+        Builds the index from an iterable of (filename, Counter[, (size, mtime_ns)]) in one pass.
+        Postings are appended as each document is read (doc ids come out sorted),
+        and the IDF is applied afterwards once per postings list: O(total postings).
+        """
+        self.close_segment()
+        doc_map = {}
+        doc_stats = {}
 
-        # 3. (TF * IDF) 
-        for term in self.vocab_list:
-            df = doc_freqs[term]
-            idf = math.log10(N / df) if df > 0 else 0
-            
-            # Search in which documents this term appears
-            # (We iterate over the docs that we know contain the term to be efficient)
-            # However, given the design, we iterate over the docs stored in memory:
-            for doc_id in self.doc_map:
-                tf = doc_term_counts[doc_id].get(term, 0)
-                
-                if tf > 0:
-                    weight = tf * idf
-                    self.index[term].append((doc_id, weight))
+        postings_docs = defaultdict(lambda: array('I')) # term -> doc ids
+        postings_tfs = defaultdict(lambda: array('I')) # term -> TF in each doc
+
+        # 1. TFs (the DF of a term is the length of its postings list)
+        with stage('indexing.collect'):
+            for doc_id, (filename, counts, *stat) in enumerate(documents, start=1):
+                doc_map[doc_id] = filename
+                doc_stats[doc_id] = stat[0] if stat else (0, 0)
 
+                for term, tf in counts.items():
+                    postings_docs[term].append(doc_id)
+                    postings_tfs[term].append(tf)
+
+        count('indexing.documents', len(doc_map))
+        self.set_postings(doc_map, doc_stats, postings_docs, postings_tfs)
+
+    def set_postings(self, doc_map, doc_stats, postings_docs, postings_tfs):
+        # 2. IDF of each term, and compression of its postings (weight = TF * IDF)
+        N = len(doc_map)
+        self.doc_map = doc_map
+        self.doc_stats = doc_stats
+        self.vocab_list = TermDictionary.from_sorted(sorted(postings_docs))
+
+        builder = PostingsBuilder()
+        with stage('indexing.compress'):
+            for term in self.vocab_list:
+                doc_ids = postings_docs.pop(term)
+                tfs = postings_tfs.pop(term)
+                builder.add_term(doc_ids, tfs, math.log10(N / len(doc_ids)))
+
+        self.store = builder.store()
+        self.index = PostingsMap(self.vocab_list, self.store)
+        self.positions = None
+        self.positions_error = None
         self.is_built = True
-        print("Index built successfully.")
+
+    def update_index(self, path=INDEX_FILE):
+        """
+        Brings the saved segment up to date with PROCESSED_DIR: only the .rep files that
+        were added or changed (size/mtime) are read. Postings of deleted or changed documents
+        are dropped, the rest is merged with the new documents and the IDF is recomputed.
+        """
+        if not os.path.exists(path):
+            print("No saved index yet: building it from scratch.")
+            self.build_index()
+            if self.is_built:
+                self.save_index(path)
+            return
+
+        files = sorted([f for f in os.listdir(PROCESSED_DIR) if f.endswith('.rep')]) \
+            if os.path.exists(PROCESSED_DIR) else []
+        current = {}
+        for filename in files:
+            st = os.stat(os.path.join(PROCESSED_DIR, filename))
+            current[filename] = (st.st_size, st.st_mtime_ns)
+
+        try:
+            segment = IndexSegment(path)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+
+        # 1. Documents of the segment that are still valid
+        doc_map = {}
+        doc_stats = {}
+        changed = deleted = 0
+        for pos, doc_id in enumerate(segment.doc_ids):
+            name = segment.doc_name(pos)
+            stat = (segment.doc_sizes[pos], segment.doc_mtimes[pos])
+            if current.get(name) == stat:
+                doc_map[doc_id] = name
+                doc_stats[doc_id] = stat
+            elif name in current:
+                changed += 1
+            else:
+                deleted += 1
+
+        known = set(doc_map.values())
+        new_files = [f for f in files if f not in known]
+        added = len(new_files) - changed
+
+        if not new_files and not deleted:
+            segment.close()
+            print("The index is up to date.")
+            self.load_index(path)
+            return
+
+        print(f"Updating index: {added} added, {changed} changed, {deleted} deleted documents...")
+
+        # 2. Keep the postings of the valid documents
+        postings_docs = defaultdict(lambda: array('I'))
+        postings_tfs = defaultdict(lambda: array('I'))
+        for idx, term in enumerate(segment.terms):
+            for doc_id, tf in segment.postings(idx).items():
+                if doc_id in doc_map:
+                    postings_docs[term].append(doc_id)
+                    postings_tfs[term].append(tf)
+
+        next_id = (segment.doc_ids[-1] + 1) if segment.n_docs else 1
+        segment.close()
+
+        # 3. Append the new documents (their ids are larger, so postings stay sorted)
+        for doc_id, (filename, counts, stat) in enumerate(self.read_counts(new_files), start=next_id):
+            doc_map[doc_id] = filename
+            doc_stats[doc_id] = stat
+            for term, tf in counts.items():
+                postings_docs[term].append(doc_id)
+                postings_tfs[term].append(tf)
+
+        self.close_segment()
+        self.set_postings(doc_map, doc_stats, postings_docs, postings_tfs)
+        self.save_index(path)
+        self.load_index(path)
+
+    def save_index(self, path=INDEX_FILE):
+        if not self.is_built:
+            print("Error: The index is not built. Run option (a) first.")
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with stage('indexing.save'):
+            size = write_segment(path, self)
+        print(f"Index saved to {path} ({size} bytes).")
+
+    def load_index(self, path=INDEX_FILE):
+        if not os.path.exists(path):
+            print(f"Error: No saved index at {path}. Build and save it first.")
+            return False
+
+        try:
+            with stage('indexing.load'):
+                segment = IndexSegment(path)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+
+        self.close_segment()
+        self.segment = segment
+        self.index = segment
+        self.vocab_list = segment.terms
+        self.doc_map = segment.doc_map
+        self.store = segment.store
+        self.doc_stats = {}
+        self.positions = None
+        self.positions_error = None
+        self.is_built = True
+        print(f"Index loaded from {path} ({segment.n_terms} terms, {segment.n_docs} documents).")
+        return True
+
+    def doc_ids(self, term):
+        # Sorted doc ids of the documents that contain the term (empty if unknown),
+        # as a sequence that only decodes the blocks that are accessed
+        idx = self.term_number(term)
+        if idx >= 0:
+            return self.store.postings(idx).doc_ids
+        return ()
+
+    def term_number(self, term):
+        # Position of the term in vocab_list (-1 if unknown)
+        return self.vocab_list.find(term)
+
+    def build_positions(self):
+        """
+        Builds the positional postings of the indexed documents, reading their .rep files
+        again. They are aligned with the postings, so the files must not have changed since
+        the index was built (the TF of every posting is checked against its positions).
+        """
+        def fail(message):
+            print(f"Error: {message}")
+            self.positions_error = message
+            return False
+
+        if not self.is_built:
+            return fail("The index is not built. Run option (a) first.")
+
+        changed = "The .rep files changed since the index was built. Update the index first."
+        with stage('indexing.positions'):
+            term_lists = defaultdict(list) # term -> [(doc_id, tf, encoded positions)]
+            for doc_id in sorted(self.doc_map):
+                filepath = os.path.join(PROCESSED_DIR, self.doc_map[doc_id])
+                if not os.path.exists(filepath):
+                    return fail(f"{filepath} no longer exists. Update the index first.")
+                for term, positions in read_positions(filepath).items():
+                    term_lists[term].append((doc_id, len(positions), encode_positions(positions)))
+
+            builder = PositionsBuilder()
+            for idx, term in enumerate(self.vocab_list):
+                entries = term_lists.pop(term, [])
+                if [(doc_id, tf) for doc_id, tf, _ in entries] != list(self.store.postings(idx).items()):
+                    return fail(changed)
+                builder.add_term(encoded for _, _, encoded in entries)
+
+            if term_lists:
+                return fail(changed)
+
+        self.positions = builder.store()
+        self.positions_error = None
+        return True
+
+    def term_positions(self, term, doc_id):
+        # Sorted positions of the term in the document (empty if it does not occur there)
+        # A failed build is not retried until the index is built or loaded again
+        if self.positions is None and (self.positions_error is not None or not self.build_positions()):
+            raise ValueError(f"Positional postings are not available: {self.positions_error}")
+
+        idx = self.term_number(term)
+        if idx < 0:
+            return []
+        i = self.store.postings(idx).find(doc_id)
+        if i < 0:
+            return []
+        return self.positions.positions(idx, i)
+
+    def doc_stat(self, doc_id):
+        # (size, mtime_ns) of the .rep file the document was indexed from
+        if self.segment is not None:
+            pos = self.segment.find_doc(doc_id)
+            return (self.segment.doc_sizes[pos], self.segment.doc_mtimes[pos])
+        return self.doc_stats.get(doc_id, (0, 0))
+
+    def signature(self):
+        # ((filename, size, mtime_ns), ...) of the indexed files, as corpus.collection_signature
+        return tuple(sorted((self.doc_map[doc_id], *self.doc_stat(doc_id)) for doc_id in self.all_doc_ids()))
+
+    def all_doc_ids(self):
+        if self.segment is not None:
+            return self.segment.doc_ids
+        return sorted(self.doc_map)
+
+    def close_segment(self):
+        # The terms, documents and postings of a loaded index are views over the mapped
+        # file: they are dropped with it, and the index is empty until it is built or loaded
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+            self.index = {}
+            self.doc_map = {}
+            self.vocab_list = TermDictionary.from_sorted([])
+            self.store = PostingsBuilder().store()
+            self.positions = None
+            self.positions_error = None
+            self.is_built = False
 
     def show_full_index(self):
         if not self.is_built:
@@ -133,7 +592,10 @@ def print_menu():
     print("a) Build index")
     print("b) Display the complete index on the screen")
     print("c) Information about a term")
-    print("d) Exit")
+    print("d) Save index to disk")
+    print("e) Load index from disk")
+    print("f) Update saved index (new, changed and deleted documents only)")
+    print("g) Exit")
 
 def main():
     system = InvertedIndex()
@@ -152,11 +614,52 @@ def main():
             system.show_term_info()
             
         elif choice == 'd':
+            system.save_index()
+
+        elif choice == 'e':
+            system.load_index()
+
+        elif choice == 'f':
+            system.update_index()
+
+        elif choice == 'g':
+            system.close_segment()
             print("Exiting...")
             break
         
         else:
             print("Invalid option.")
 
+# Function to build the in-memory index of the shared corpus
+def build_corpus_index(corpus):
+    index = InvertedIndex()
+    index.build_from_counts(corpus.documents())
+    return index
+
+# Function to get the inverted index: the saved segment if it still describes the .rep
+# files (same names, sizes and mtimes), otherwise the index built from the shared corpus.
+# That one is built once and kept with the corpus (like the vector model engine), so
+# coming back to a model does not build it again; its positional postings are kept too.
+# Closing it is harmless: close_segment() only releases an index loaded from a segment.
+def load_index(path=INDEX_FILE):
+    index = InvertedIndex()
+    if os.path.exists(path) and index.load_index(path):
+        if index.signature() == collection_signature():
+            return index
+        print("Warning: The saved index is out of date (the .rep files changed since it was saved); "
+              "building it again. Run 'python src/indexing.py --update' to refresh the file.")
+        index.close_segment()
+        index = InvertedIndex()
+
+    corpus = get_corpus()
+    if not corpus.doc_names:
+        print("No .rep files in the directory 'processed'.")
+        return index
+    return corpus.cached('inverted-index', lambda: build_corpus_index(corpus))
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--update' in sys.argv[1:]:
+        # Non-interactive update, e.g. after 'normalization.py --batch --incremental'
+        InvertedIndex().update_index()
+    else:
+        main()
\ No newline at end of file
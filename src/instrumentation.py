@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import math
+import time
+import atexit
+import signal
+from collections import defaultdict, Counter
+
+# Lightweight instrumentation of the pipeline stages (normalization, indexing and the
+# query evaluation of the three models).
+#
+#   IR_INSTRUMENT=1                 record per-stage latency histograms and counters
+#   IR_INSTRUMENT_REPORT=path.json  where the report is written at exit (default: a
+#                                   summary on standard error)
+#   IR_PROFILE=cprofile | sample    also capture a cProfile or a sampling profile
+#
+# When it is off, stage() returns a shared no-op context manager and count() returns at
+# once (a few hundred nanoseconds per stage). Stages wrap whole calls (a query, a file,
+# an index build), never the per-posting loops, so this is negligible next to the work.
+# Every process records its own data (batch normalization workers are not merged).
+ENABLED = os.environ.get('IR_INSTRUMENT', '') not in ('', '0')
+REPORT_FILE = os.environ.get('IR_INSTRUMENT_REPORT')
+PROFILE_MODE = os.environ.get('IR_PROFILE')
+SAMPLE_INTERVAL = 0.005 # Seconds of CPU time between samples of the sampling profiler
+TOP_FUNCTIONS = 25 # Functions listed in the profile section of the report
+
+class Histogram:
+    """Latencies in power-of-two buckets of microseconds: constant memory per stage."""
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = Counter() # bucket b holds latencies in [2^(b-1), 2^b) us
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+
+    def percentile(self, p):
+        # Upper bound of the bucket that holds the p-th percentile (never above the maximum)
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def report(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 4),
+            'mean_ms': round(self.total / self.count * 1000, 4),
+            'min_ms': round(self.min * 1000, 4),
+            'p50_ms': round(self.percentile(50) * 1000, 4),
+            'p99_ms': round(self.percentile(99) * 1000, 4),
+            'max_ms': round(self.max * 1000, 4),
+        }
+
+_histograms = defaultdict(Histogram)
+_counters = Counter()
+_profiler = None
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _histograms[self.name].add(time.perf_counter() - self.start)
+        return False
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+# Functions used by the instrumented modules
+def stage(name):
+    """Context manager that times a block: with stage('indexing.build'): ..."""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+def count(name, n=1):
+    if ENABLED:
+        _counters[name] += n
+
+# Profilers
+class SamplingProfiler:
+    """Counts the function on top of the stack every SAMPLE_INTERVAL of CPU time (Unix only)."""
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+
+    def handler(self, signum, frame):
+        if frame is not None:
+            code = frame.f_code
+            self.samples[f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}:{code.co_name}"] += 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self.handler)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+    def report(self):
+        return {
+            'mode': 'sample',
+            'interval_s': self.interval,
+            'samples': sum(self.samples.values()),
+            'top': [{'function': name, 'samples': n} for name, n in self.samples.most_common(TOP_FUNCTIONS)],
+        }
+
+class CProfiler:
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self):
+        import pstats
+        stats = pstats.Stats(self.profile).stats
+        top = sorted(stats.items(), key=lambda item: -item[1][3])[:TOP_FUNCTIONS]
+        return {
+            'mode': 'cprofile',
+            'top': [{'function': f"{os.path.basename(filename)}:{line}:{name}", 'calls': calls,
+                     'self_ms': round(self_time * 1000, 3), 'cumulative_ms': round(cumulative * 1000, 3)}
+                    for (filename, line, name), (_, calls, self_time, cumulative, _) in top],
+        }
+
+def start_profiler(mode):
+    global _profiler
+    if _profiler is not None:
+        return
+    if mode == 'cprofile':
+        _profiler = CProfiler()
+    elif mode == 'sample':
+        if not hasattr(signal, 'setitimer'):
+            print("Warning: The sampling profiler is not available on this platform.", file=sys.stderr)
+            return
+        _profiler = SamplingProfiler()
+    else:
+        print(f"Warning: Unknown profiler '{mode}' (use 'cprofile' or 'sample').", file=sys.stderr)
+        return
+    _profiler.start()
+
+def stop_profiler():
+    if _profiler is not None:
+        _profiler.stop()
+
+# Functions to control the instrumentation from code (e.g. benchmarks)
+def enable(profile=None):
+    global ENABLED
+    ENABLED = True
+    if profile:
+        start_profiler(profile)
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    stop_profiler()
+
+def reset():
+    global _profiler
+    stop_profiler()
+    _profiler = None
+    _histograms.clear()
+    _counters.clear()
+
+def report():
+    data = {
+        'stages': {name: _histograms[name].report() for name in sorted(_histograms)},
+        'counters': dict(sorted(_counters.items())),
+    }
+    if _profiler is not None:
+        data['profile'] = _profiler.report()
+    return data
+
+def write_report(path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report(), f, indent=2)
+    os.replace(tmp_path, path)
+
+def print_summary(file=sys.stderr):
+    data = report()
+    print(f"\n--- Instrumentation ({os.getpid()}) ---", file=file)
+    print(f"{'Stage':<28} {'Count':>8} {'Total (ms)':>12} {'p50 (ms)':>10} {'p99 (ms)':>10}", file=file)
+    for name, stage_report in data['stages'].items():
+        print(f"{name:<28} {stage_report['count']:>8} {stage_report['total_ms']:>12.3f} "
+              f"{stage_report['p50_ms']:>10.3f} {stage_report['p99_ms']:>10.3f}", file=file)
+    for name, value in data['counters'].items():
+        print(f"{name:<28} {value:>8}", file=file)
+    for entry in data.get('profile', {}).get('top', [])[:10]:
+        print(f"  {entry}", file=file)
+
+def _finish():
+    if not (_histograms or _counters or _profiler):
+        return
+    stop_profiler()
+    if REPORT_FILE:
+        write_report(REPORT_FILE)
+    else:
+        print_summary()
+
+if ENABLED:
+    if PROFILE_MODE:
+        start_profiler(PROFILE_MODE)
+    atexit.register(_finish)
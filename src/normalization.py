@@ -2,12 +2,27 @@ import os
 import re
 import unicodedata
 import sys
+import time
+import json
+import hashlib
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from instrumentation import stage, count
+from corpus import read_file, list_files
 
 # --- Configuration Paths ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 PROCESSED_DIR = os.path.join(BASE_DIR, 'processed')
 STOPWORDS_FILE = os.path.join(DATA_DIR, 'stopwords.txt') 
+CHUNK_SIZE = 1 << 20 # Characters read at a time by the streaming tokenizer
+# {source .txt: {size, mtime_ns, sha1}} of the documents that have been normalized
+MANIFEST_FILE = os.path.join(PROCESSED_DIR, 'manifest.json')
+TERM_CACHE_SIZE = 1 << 16 # Distinct surface forms remembered by normalize_term
+
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
 
 def load_stopwords(filepath):
     if not os.path.exists(filepath):
@@ -21,12 +36,59 @@ def load_stopwords(filepath):
         with open(filepath, 'r', encoding='iso-8859-1') as f:
             return set(word.strip().lower() for word in f)
 
+class AccentTable(dict):
+    """
+    str.translate table: code point -> the character without its combining marks.
+    Latin ranges are precomputed; any other character is computed (NFD, then the
+    non-spacing marks are dropped) the first time it is seen and kept in the table.
+    """
+    def __missing__(self, code):
+        char = chr(code)
+        # NFD decomposes characters, then we filter out non-spacing mark characters
+        stripped = "".join([c for c in unicodedata.normalize('NFD', char) if not unicodedata.combining(c)])
+        self[code] = code if stripped == char else stripped
+        return self[code]
+
+ACCENT_TABLE = AccentTable()
+for _code in list(range(0x250)) + list(range(0x300, 0x370)) + list(range(0x1E00, 0x1F00)):
+    ACCENT_TABLE[_code]
+
 def remove_accents(text):
     """Normalizes text to remove tildes (e.g., 'canción' -> 'cancion')."""
-    # NFD decomposes characters 
-    nfkd_form = unicodedata.normalize('NFD', text)
-    # We filter out non-spacing mark characters
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+    if text.isascii():
+        return text
+    return text.translate(ACCENT_TABLE)
+
+@lru_cache(maxsize=TERM_CACHE_SIZE)
+def normalize_term(term):
+    """Normalizes a single query/document word (cached: the same surface forms repeat a lot)."""
+    term = term.lower().strip()
+    term = remove_accents(term)
+    term = PUNCTUATION_RE.sub('', term)
+    return term
+
+# Functions for the ranked query models (vector model and sharded index): query words
+# and document terms go through the same filter, so both sides share one vocabulary
+def load_query_stopwords(filepath=STOPWORDS_FILE):
+    # Stop-words normalized like the query words (separated by newlines or spaces)
+    stops = set()
+    if os.path.exists(filepath):
+        for encoding in ('utf-8', 'iso-8859-1'):
+            try:
+                with open(filepath, 'r', encoding=encoding) as f:
+                    stops = {normalize_term(word) for word in f.read().split()}
+                break
+            except UnicodeDecodeError:
+                continue
+    return stops
+
+def tokenize(text, stopwords):
+    tokens = []
+    for w in text.split():
+        norm = normalize_term(w)
+        if norm and norm not in stopwords and not norm.isnumeric():
+            tokens.append(norm)
+    return tokens
 
 def clean_text(text, stopwords):
     """
@@ -35,49 +97,272 @@ def clean_text(text, stopwords):
     3. Remove punctuation 
     4. Remove stop words
     """
-    # 1. Lowercase
-    text = text.lower()
-    
-    # 2. Remove accents
-    text = remove_accents(text)
-    
-    # 3. Remove punctuation and special characters
-    text = re.sub(r'[^\w\s]', '', text)
-    
-    # 4. Tokenize (split by whitespace)
-    tokens = text.split()
-    
-    # 5. Remove Stopwords
-    clean_tokens = [t for t in tokens if t not in stopwords]
-    
-    return clean_tokens
+    with stage('normalization.clean_text'):
+        # 1. Lowercase
+        text = text.lower()
 
-def read_file(filepath):
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
-    except UnicodeDecodeError:
-        with open(filepath, 'r', encoding='iso-8859-1') as f:
-            return f.read()
+        # 2. Remove accents
+        text = remove_accents(text)
+
+        # 3. Remove punctuation and special characters
+        text = PUNCTUATION_RE.sub('', text)
+
+        # 4. Tokenize (split by whitespace)
+        tokens = text.split()
+
+        # 5. Remove Stopwords
+        clean_tokens = [t for t in tokens if t not in stopwords]
+
+        return clean_tokens
+
+def iter_clean_tokens(chunks, stopwords):
+    """
+    Streaming version of clean_text: takes an iterable of text chunks and yields the clean tokens.
+    A chunk is only cleaned up to its last whitespace; the (possibly cut) word after it is
+    carried over to the next chunk, so the tokens are the same as clean_text on the whole text.
+    """
+    carry = []
+    for chunk in chunks:
+        cut = len(chunk) - 1
+        while cut >= 0 and not chunk[cut].isspace():
+            cut -= 1
+
+        if cut < 0:
+            # No whitespace: the chunk is the middle of a (very long) word
+            carry.append(chunk)
+            continue
+
+        carry.append(chunk[:cut + 1])
+        yield from clean_text("".join(carry), stopwords)
+        carry = [chunk[cut + 1:]]
+
+    if carry:
+        yield from clean_text("".join(carry), stopwords)
+
+def iter_file_chunks(filepath, encoding, chunk_size=CHUNK_SIZE):
+    # Only the reads are timed (one stage per chunk), not the cleaning done between them
+    with open(filepath, 'r', encoding=encoding) as f:
+        while True:
+            with stage('normalization.read_file'):
+                chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
 
 def save_rep_file(filename, tokens):
     """Saves the normalized tokens into a .rep file."""
-    if not os.path.exists(PROCESSED_DIR):
-        os.makedirs(PROCESSED_DIR)
+    return save_rep_stream(filename, tokens)[0]
+
+def save_rep_stream(filename, tokens, batch_size=4096):
+    """Saves the tokens of any iterable (e.g. a generator) into a .rep file. Returns (rep name, count)."""
+    # exist_ok: several worker processes may get here at the same time
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
         
     rep_filename = os.path.splitext(filename)[0] + ".rep"
     rep_path = os.path.join(PROCESSED_DIR, rep_filename)
+    count = 0
     
     with open(rep_path, 'w', encoding='utf-8') as f:
-        # Saving tokens separated by newlines
-        f.write("\n".join(tokens))
+        # Saving tokens separated by newlines, a batch at a time
+        batch = []
+        for token in tokens:
+            batch.append(token)
+            if len(batch) == batch_size:
+                f.write(("\n" if count else "") + "\n".join(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            f.write(("\n" if count else "") + "\n".join(batch))
+            count += len(batch)
     
-    return rep_filename
+    return rep_filename, count
+
+def file_fingerprint(filepath):
+    """Size, mtime and SHA-1 of a file (read in blocks, whatever its size)."""
+    st = os.stat(filepath)
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': sha1.hexdigest()}
+
+def normalize_file(filename, stopwords, chunk_size=CHUNK_SIZE):
+    """Reads, cleans and saves one document of DATA_DIR. Returns (rep name, terms, manifest entry)."""
+    with stage('normalization.file'):
+        full_path = os.path.join(DATA_DIR, filename)
+        # Fingerprint first: if the file changes while it is read, the next update sees it
+        entry = file_fingerprint(full_path)
+
+        # The file is streamed in chunks straight into the .rep writer (constant memory).
+        # If it is not valid UTF-8 the .rep is written again from the start as ISO-8859-1.
+        try:
+            tokens = iter_clean_tokens(iter_file_chunks(full_path, 'utf-8', chunk_size), stopwords)
+            out_name, n_terms = save_rep_stream(filename, tokens)
+        except UnicodeDecodeError:
+            tokens = iter_clean_tokens(iter_file_chunks(full_path, 'iso-8859-1', chunk_size), stopwords)
+            out_name, n_terms = save_rep_stream(filename, tokens)
+
+        count('normalization.documents')
+        count('normalization.terms', n_terms)
+        return out_name, n_terms, entry
+
+# --- Manifest (incremental normalization) ---
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        print("Warning: The manifest is unreadable, every document will be normalized again.")
+        return {}
 
-def list_files(directory, extension):
-    if not os.path.exists(directory):
-        return []
-    return sorted([f for f in os.listdir(directory) if f.endswith(extension)])
+def save_manifest(manifest):
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    tmp_path = MANIFEST_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def scan_changes(manifest, files):
+    """
+    Compares the source documents with the manifest.
+    Returns (files to normalize, deleted files, unchanged count). Files whose mtime changed
+    but whose content hash did not are unchanged (their manifest entry is refreshed).
+    """
+    to_process = []
+    unchanged = 0
+
+    for filename in files:
+        entry = manifest.get(filename)
+        full_path = os.path.join(DATA_DIR, filename)
+        st = os.stat(full_path)
+
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            unchanged += 1
+            continue
+
+        if entry and entry['size'] == st.st_size:
+            fingerprint = file_fingerprint(full_path)
+            if fingerprint['sha1'] == entry['sha1']:
+                manifest[filename] = fingerprint
+                unchanged += 1
+                continue
+
+        to_process.append(filename)
+
+    present = set(files)
+    deleted = [f for f in manifest if f not in present]
+    return to_process, deleted, unchanged
+
+def normalize_incremental(stopwords, workers=None, chunk_size=64, verbose=False):
+    """Normalizes only the added or changed documents and removes the .rep of deleted ones."""
+    manifest = load_manifest()
+    files = list_documents()
+    to_process, deleted, unchanged = scan_changes(manifest, files)
+    print(f"{len(to_process)} new or changed, {len(deleted)} deleted, {unchanged} unchanged documents.")
+
+    for filename in deleted:
+        rep_path = os.path.join(PROCESSED_DIR, os.path.splitext(filename)[0] + ".rep")
+        if os.path.exists(rep_path):
+            os.remove(rep_path)
+        del manifest[filename]
+        if verbose:
+            print(f"Removed: {filename}")
+
+    errors = []
+    if to_process:
+        errors = normalize_batch(to_process, stopwords, workers=workers, chunk_size=chunk_size,
+                                 verbose=verbose, manifest=manifest)
+
+    save_manifest(manifest)
+    return errors
+
+# --- Batch (multi-process) normalization ---
+# The pool runs the functions of the importable 'normalization' module, not those of
+# __main__ (this file run as a script, or through runpy from main.py): with the spawn and
+# forkserver start methods a worker only finds functions it can import. Such a worker
+# starts from a fresh import, so the directories are sent along with the stopwords.
+_worker_stopwords = None
+
+def _init_worker(stopwords, data_dir=DATA_DIR, processed_dir=PROCESSED_DIR):
+    # Stopwords are sent once per worker process, not once per chunk
+    global _worker_stopwords, DATA_DIR, PROCESSED_DIR
+    _worker_stopwords = stopwords
+    DATA_DIR = data_dir
+    PROCESSED_DIR = processed_dir
+
+def _normalize_chunk(filenames):
+    # Errors are reported per file so that one bad document does not stop the batch
+    results = []
+    for filename in filenames:
+        try:
+            out_name, n_terms, entry = normalize_file(filename, _worker_stopwords)
+            results.append((filename, out_name, n_terms, entry, None))
+        except Exception as e:
+            results.append((filename, None, 0, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def normalize_batch(files, stopwords, workers=None, chunk_size=64, max_in_flight=None,
+                    verbose=False, manifest=None, mp_context=None):
+    """
+    Normalizes 'files' (names inside DATA_DIR) on a pool of processes.
+    Files are sent in chunks and at most 'max_in_flight' chunks are pending at any time,
+    so memory stays bounded however large the batch is.
+    The manifest entries of the normalized files are stored in 'manifest' if given.
+    'mp_context' selects the start method (default: the one of the platform).
+    Returns the list of (filename, error) of the files that failed.
+    """
+    import normalization as worker
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    chunks = (files[i:i + chunk_size] for i in range(0, len(files), chunk_size))
+
+    stats = {'processed': 0, 'terms': 0, 'bytes': 0}
+    errors = []
+    start = time.perf_counter()
+
+    def collect(future):
+        for filename, out_name, n_terms, entry, error in future.result():
+            if error:
+                errors.append((filename, error))
+                print(f"Error: {filename}: {error}")
+                continue
+            stats['processed'] += 1
+            stats['terms'] += n_terms
+            stats['bytes'] += entry['size']
+            if manifest is not None:
+                manifest[filename] = entry
+            if verbose:
+                print(f"Processed: {filename} -> {out_name} ({n_terms} terms)")
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=worker._init_worker,
+                             initargs=(stopwords, DATA_DIR, PROCESSED_DIR)) as pool:
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(worker._normalize_chunk, chunk))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+
+        for future in pending:
+            collect(future)
+
+    elapsed = time.perf_counter() - start
+    rate = stats['processed'] / elapsed if elapsed > 0 else 0.0
+    mb_rate = stats['bytes'] / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+    print(f"\n--- Batch summary ---")
+    print(f"Documents: {stats['processed']} ok, {len(errors)} failed ({workers} workers)")
+    print(f"Terms: {stats['terms']}")
+    print(f"Time: {elapsed:.2f} s ({rate:.1f} docs/s, {mb_rate:.2f} MB/s)")
+
+    return errors
+
+def list_documents():
+    # Source documents of the corpus (the stopwords list lives in the same folder)
+    stopwords_name = os.path.basename(STOPWORDS_FILE)
+    return [f for f in list_files(DATA_DIR, '.txt') if f != stopwords_name]
 
 # --- Menu Functions ---
 def menu_list_originals():
@@ -119,11 +404,14 @@ def menu_show_normalized():
         print("Error: File not found. Have you normalized it yet?")
 
 def menu_normalize_doc(stopwords):
-    fname = input("Enter filename to normalize (or 'all' for all files): ").strip()
+    fname = input("Enter filename to normalize ('all' for all files, 'changed' for new/changed files only): ").strip()
     
     files_to_process = []
-    if fname.lower() == 'all':
-        files_to_process = list_files(DATA_DIR, '.txt')
+    if fname.lower() == 'changed':
+        normalize_incremental(stopwords, verbose=True)
+        return
+    elif fname.lower() == 'all':
+        files_to_process = list_documents()
     else:
         path = os.path.join(DATA_DIR, fname)
         if os.path.exists(path):
@@ -132,12 +420,16 @@ def menu_normalize_doc(stopwords):
             print("Error: File not found.")
             return
 
-    for f in files_to_process:
-        full_path = os.path.join(DATA_DIR, f)
-        raw_text = read_file(full_path)
-        tokens = clean_text(raw_text, stopwords)
-        out_name = save_rep_file(f, tokens)
-        print(f"Processed: {f} -> {out_name} ({len(tokens)} terms)")
+    manifest = load_manifest()
+
+    if len(files_to_process) > 1:
+        normalize_batch(files_to_process, stopwords, verbose=True, manifest=manifest)
+    else:
+        for f in files_to_process:
+            out_name, n_terms, manifest[f] = normalize_file(f, stopwords)
+            print(f"Processed: {f} -> {out_name} ({n_terms} terms)")
+
+    save_manifest(manifest)
 
 def main():
     stopwords = load_stopwords(STOPWORDS_FILE)
@@ -170,9 +462,43 @@ def main():
         else:
             print("Invalid option. Please try again.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Text normalization (interactive menu by default).")
+    parser.add_argument('--batch', action='store_true',
+                        help="Normalize documents of the data folder in parallel, without the menu.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Batch mode: only new or changed documents (see processed/manifest.json).")
+    parser.add_argument('files', nargs='*',
+                        help="Files of the data folder to normalize in batch mode (default: all).")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Documents per task sent to a worker.")
+    return parser.parse_args()
+
+def batch_main(args):
+    stopwords = load_stopwords(STOPWORDS_FILE)
+
+    if args.incremental:
+        errors = normalize_incremental(stopwords, workers=args.workers, chunk_size=args.chunk_size)
+        return 1 if errors else 0
+
+    files = args.files or list_documents()
+    if not files:
+        print("No .txt files to normalize.")
+        return 0
+
+    manifest = load_manifest()
+    errors = normalize_batch(files, stopwords, workers=args.workers, chunk_size=args.chunk_size,
+                             manifest=manifest)
+    save_manifest(manifest)
+    return 1 if errors else 0
+
 if __name__ == "__main__":
+    args = parse_args()
+
     if not os.path.exists(DATA_DIR):
         print(f"Error: Data directory not found at {DATA_DIR}")
         print("Please create the 'data' folder and add your .txt files.")
+    elif args.batch or args.incremental:
+        sys.exit(batch_main(args))
     else:
         main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+from array import array
+from collections import defaultdict
+
+# Positional postings: for every posting (term, document) the positions of the term in
+# the .rep file of the document, counted from 0 over its terms (stop-words are already
+# removed by the normalization, so "casa de papel" is the phrase "casa papel").
+# They are kept in the same order as the compressed postings (term number, then doc id),
+# so the positions of the i-th posting of a term are entry term_entries[term] + i.
+# Each list is stored as gaps in variable-byte encoding: 7 bits per byte, and the high
+# bit set on every byte of a gap except the last one.
+
+def encode_positions(positions):
+    data = bytearray()
+    previous = 0
+    for position in positions:
+        gap = position - previous
+        previous = position
+        while gap >= 0x80:
+            data.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        data.append(gap)
+    return bytes(data)
+
+def decode_positions(data, start, end):
+    positions = []
+    position = gap = shift = 0
+    for byte in data[start:end]:
+        gap |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            position += gap
+            positions.append(position)
+            gap = shift = 0
+    return positions
+
+# Function to read the positions of every term of a .rep file, line by line
+def read_positions(filepath):
+    for encoding in ('utf-8', 'iso-8859-1'):
+        positions = defaultdict(list)
+        position = 0
+        try:
+            with open(filepath, 'r', encoding=encoding) as f:
+                for line in f:
+                    for term in line.split():
+                        positions[term].append(position)
+                        position += 1
+            return positions
+        except UnicodeDecodeError:
+            continue
+
+class PositionsBuilder:
+    """Appends the encoded position lists of each term (in term number order)."""
+    def __init__(self):
+        self.term_entries = array('Q', [0]) # term -> first entry (term + 1 -> end)
+        self.offsets = array('Q', [0]) # entry -> start in data (entry + 1 -> end)
+        self.data = bytearray()
+
+    def add_term(self, encoded_lists):
+        for encoded in encoded_lists:
+            self.data += encoded
+            self.offsets.append(len(self.data))
+        self.term_entries.append(len(self.offsets) - 1)
+
+    def store(self):
+        return PositionsStore(self.term_entries, self.offsets, bytes(self.data))
+
+class PositionsStore:
+    def __init__(self, term_entries, offsets, data):
+        self.term_entries = term_entries
+        self.offsets = offsets
+        self.data = data
+
+    def positions(self, term_number, i):
+        # Sorted positions of the i-th posting of the term
+        entry = self.term_entries[term_number] + i
+        return decode_positions(self.data, self.offsets[entry], self.offsets[entry + 1])
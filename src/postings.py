@@ -0,0 +1,198 @@
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from collections.abc import Sequence
+
+# Compressed postings storage shared by the in-memory index and the binary segment.
+#
+# The postings of a term are cut into blocks of BLOCK_SIZE. In each block the doc ids
+# are stored as gaps (the first one relative to the last doc id of the previous block)
+# and the TFs follow; both use the smallest byte width (1, 2 or 4) that fits the
+# largest value of the block (byte-aligned frame of reference), so a block decodes
+# with a single array.frombytes + accumulate.
+# Weights are not stored: in this index a weight is tf * idf, so one idf per term
+# rebuilds them exactly.
+BLOCK_SIZE = 128
+WIDTH_TYPECODES = {1: 'B', 2: 'H', 4: 'I'}
+
+def _width(values):
+    largest = max(values, default=0)
+    if largest < 1 << 8:
+        return 1
+    if largest < 1 << 16:
+        return 2
+    return 4
+
+class PostingsBuilder:
+    """Appends the postings of each term (in term number order) into flat arrays."""
+    def __init__(self):
+        self.idfs = array('d') # term -> idf
+        self.dfs = array('I') # term -> number of postings
+        self.term_blocks = array('Q', [0]) # term -> first block (term + 1 -> end)
+        self.last_docs = array('I') # block -> last doc id of the block
+        self.offsets = array('Q', [0]) # block -> start in data (block + 1 -> end)
+        self.widths = bytearray() # block -> gap width | tf width << 4
+        self.data = bytearray()
+
+    def add_term(self, doc_ids, tfs, idf):
+        self.idfs.append(idf)
+        self.dfs.append(len(doc_ids))
+
+        previous = 0
+        for start in range(0, len(doc_ids), BLOCK_SIZE):
+            block_docs = doc_ids[start:start + BLOCK_SIZE]
+            block_tfs = tfs[start:start + BLOCK_SIZE]
+
+            gaps = [block_docs[0] - previous]
+            gaps.extend(b - a for a, b in zip(block_docs, block_docs[1:]))
+            gap_width = _width(gaps)
+            tf_width = _width(block_tfs)
+
+            self.data += array(WIDTH_TYPECODES[gap_width], gaps).tobytes()
+            self.data += array(WIDTH_TYPECODES[tf_width], block_tfs).tobytes()
+            self.offsets.append(len(self.data))
+            self.widths.append(gap_width | tf_width << 4)
+            self.last_docs.append(block_docs[-1])
+            previous = block_docs[-1]
+
+        self.term_blocks.append(len(self.last_docs))
+
+    def store(self):
+        return PostingsStore(self.idfs, self.dfs, self.term_blocks, self.last_docs,
+                             self.offsets, bytes(self.widths), bytes(self.data))
+
+class PostingsStore:
+    """Flat arrays (or memoryviews over a mapped segment) with the postings of every term."""
+    def __init__(self, idfs, dfs, term_blocks, last_docs, offsets, widths, data):
+        self.idfs = idfs
+        self.dfs = dfs
+        self.term_blocks = term_blocks
+        self.last_docs = last_docs
+        self.offsets = offsets
+        self.widths = widths
+        self.data = data
+
+    def __len__(self):
+        return len(self.dfs)
+
+    def postings(self, term_number):
+        return CompressedPostings(self, term_number)
+
+    def decode_block(self, block, base):
+        # Returns (doc ids, tfs) of a block; 'base' is the last doc id of the previous block
+        start, end = self.offsets[block], self.offsets[block + 1]
+        width = self.widths[block]
+        gap_width, tf_width = width & 0xF, width >> 4
+        count = (end - start) // (gap_width + tf_width)
+        middle = start + count * gap_width
+
+        gaps = array(WIDTH_TYPECODES[gap_width])
+        gaps.frombytes(self.data[start:middle])
+        tfs = array(WIDTH_TYPECODES[tf_width])
+        tfs.frombytes(self.data[middle:end])
+
+        doc_ids = list(accumulate(gaps, initial=base))
+        del doc_ids[0]
+        return doc_ids, tfs
+
+    def nbytes(self):
+        # Size of the postings storage (everything except the term dictionary)
+        return sum(len(part) * getattr(part, 'itemsize', 1) for part in
+                   (self.idfs, self.dfs, self.term_blocks, self.last_docs,
+                    self.offsets, self.widths, self.data))
+
+class CompressedPostings:
+    """
+    Postings of one term, decoded lazily a block at a time.
+    Iterating yields (doc_id, weight) pairs, like the old list of tuples.
+    """
+    __slots__ = ('store', 'idf', 'df', 'first_block', 'end_block')
+
+    def __init__(self, store, term_number):
+        self.store = store
+        self.idf = store.idfs[term_number]
+        self.df = store.dfs[term_number]
+        self.first_block = store.term_blocks[term_number]
+        self.end_block = store.term_blocks[term_number + 1]
+
+    def __len__(self):
+        return self.df
+
+    def block(self, block):
+        base = self.store.last_docs[block - 1] if block > self.first_block else 0
+        return self.store.decode_block(block, base)
+
+    def find(self, doc_id):
+        # Position of doc_id in the postings list (-1 if it is not there): the block is
+        # found from the last doc ids of the blocks, and only that block is decoded
+        block = bisect_left(self.store.last_docs, doc_id, self.first_block, self.end_block)
+        if block == self.end_block:
+            return -1
+        doc_ids = self.block(block)[0]
+        i = bisect_left(doc_ids, doc_id)
+        if i < len(doc_ids) and doc_ids[i] == doc_id:
+            return (block - self.first_block) * BLOCK_SIZE + i
+        return -1
+
+    def items(self):
+        # (doc_id, tf) pairs
+        for block in range(self.first_block, self.end_block):
+            doc_ids, tfs = self.block(block)
+            yield from zip(doc_ids, tfs)
+
+    def __iter__(self):
+        idf = self.idf
+        for doc_id, tf in self.items():
+            yield doc_id, tf * idf
+
+    @property
+    def doc_ids(self):
+        return DocIdView(self)
+
+class DocIdView(Sequence):
+    """Sorted doc ids of a term as a sequence; only the blocks that are accessed get decoded."""
+    __slots__ = ('postings', 'cached_block', 'cached_docs')
+
+    def __init__(self, postings):
+        self.postings = postings
+        self.cached_block = -1
+        self.cached_docs = None
+
+    def __len__(self):
+        return self.postings.df
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('posting out of range')
+
+        block = self.postings.first_block + i // BLOCK_SIZE
+        if block != self.cached_block:
+            self.cached_docs = self.postings.block(block)[0]
+            self.cached_block = block
+        return self.cached_docs[i % BLOCK_SIZE]
+
+    def __iter__(self):
+        for block in range(self.postings.first_block, self.postings.end_block):
+            yield from self.postings.block(block)[0]
+
+    def seek(self, doc_id, lo=0):
+        # First position >= lo whose doc id is >= doc_id (len if there is none). The block
+        # is found by binary search over the last doc ids of the blocks, so the blocks that
+        # are skipped are never decoded
+        postings = self.postings
+        if lo >= len(self):
+            return len(self)
+        first = postings.first_block
+        block = bisect_left(postings.store.last_docs, doc_id, first + lo // BLOCK_SIZE, postings.end_block)
+        if block == postings.end_block:
+            return len(self)
+
+        if block != self.cached_block:
+            self.cached_docs = self.postings.block(block)[0]
+            self.cached_block = block
+        start = (block - first) * BLOCK_SIZE
+        return start + bisect_left(self.cached_docs, doc_id, max(lo - start, 0))
@@ -1,8 +1,13 @@
 import os
-import re
-import unicodedata
 import math
 import sys
+from array import array
+from collections import Counter
+
+from normalization import normalize_term
+from corpus import get_corpus, read_file, list_files
+from instrumentation import stage, count
+from ranking import TermCursor, max_score_top_k
 
 # Configuration Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -10,32 +15,12 @@ DATA_DIR = os.path.join(BASE_DIR, 'data')
 PROCESSED_DIR = os.path.join(BASE_DIR, 'processed')
 STOPWORDS_FILE = os.path.join(DATA_DIR, 'stopwords.txt')
 
-# Function for read the files
-def read_file(filepath):
-    try:
-        with open(filepath, 'r', encoding = 'utf-8') as f:
-            return f.read()
-        
-    except UnicodeDecodeError:
-        with open(filepath, 'r', encoding = 'iso-8859-1') as f:
-            return f.read()
-
-# Function for normalize the terms
-def remove_accents(text):
-    nfkd_form = unicodedata.normalize('NFD', text)
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-
-def normalize_term(term):
-    term = term.lower().strip()
-    term = remove_accents(term)
-    term = re.sub(r'[^\w\s]', '', term)
-    return term
-
-# Function to list de documents
-def list_files(directory, extension):
-    if not os.path.exists(directory):
-        return []
-    return sorted([f for f in os.listdir(directory) if f.endswith(extension)])
+# BM25 parameters
+BM25_K1 = 1.2 # TF saturation
+BM25_B = 0.75 # Document length normalization
+
+# Results listed in each feedback iteration (best first, selected with MaxScore pruning)
+MENU_RESULTS = 10
 
 # Function to show normalized documents
 def menu_list_normalized():
@@ -76,22 +61,121 @@ def menu_show_normalized():
     else:
         print("Error: File not found. Have you normalized it yet?")
 
-# Function to resolve a query, with the probabilistic method
-def resolve_query():
-    processed_files = list_files(PROCESSED_DIR, '.rep')
+# Function to get the collection: document list and postings lists
+# {term: sorted doc numbers (positions in the document list)}, from the shared corpus
+# (a view over its arrays indexed by term id).
+# The document frequency n_t of a term is the length of its postings list.
+def load_collection():
+    corpus = get_corpus()
+    return corpus.doc_names, corpus.term_postings()
+
+# Function for the Robertson/Sparck Jones term weight
+def term_weight(n_t, r_t, N, R):
+    # w = log( (r_t + 0.5) / (R - r_t + 0.5) / ((n_t - r_t + 0.5) / (N - n_t - R + r_t + 0.5)) )
+    numerator = (r_t + 0.5) / (R - r_t + 0.5)
+    denominator = (n_t - r_t + 0.5) / (N - n_t - R + r_t + 0.5)
+    return math.log(numerator / denominator)
+
+# Function to rank the documents that contain at least one query term.
+# Returns (doc number, score) sorted by score, or only the best k if k is given.
+def rank_documents(query_terms, postings, total_docs_N, relevant_counts, R, k=None):
+    # The weight of a term only depends on (n_t, r_t), so it is computed once per term
+    # and added to the documents of its postings list.
+    term_weights = []
+    for term, qtf in Counter(query_terms).items():
+        docs = postings.get(term)
+        if docs:
+            weight = term_weight(len(docs), relevant_counts[term], total_docs_N, R) * qtf
+            term_weights.append((docs, weight))
+
+    if k is not None:
+        # Every document of a term gets the same weight, so it is also its upper bound
+        cursors = [TermCursor(docs, None, weight, 1.0, order)
+                   for order, (docs, weight) in enumerate(term_weights)]
+        with stage('probabilistic.top_k'):
+            return max_score_top_k(cursors, k)
+
+    with stage('probabilistic.score'):
+        scores = {}
+        for docs, weight in term_weights:
+            count('probabilistic.postings_read', len(docs))
+            for doc in docs:
+                scores[doc] = scores.get(doc, 0.0) + weight
+
+    # Ties keep the document order
+    with stage('probabilistic.sort'):
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+# BM25: the TF component of every posting, tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)),
+# only depends on the document, so it is precomputed once per collection (the "impact").
+# A query term adds w_t * impact to each document of its postings, with w_t the
+# Robertson/Sparck Jones weight (the BM25 IDF without feedback, r_t and R with it).
+# That weight is negative for a term of more than half of the documents (n_t > N / 2
+# without feedback), which would rank the documents containing it below those that do
+# not: the BM25 mode clamps it at 0, so such a term matches but adds nothing.
+# There is a single field (the .rep terms), so BM25F reduces to BM25.
+# The impacts are kept in memory with the corpus and not in the index segment: they
+# depend on k1 and b, and computing them is one pass over the postings already loaded.
+class BM25Index:
+    def __init__(self, corpus, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        avgdl = sum(corpus.doc_lengths) / len(corpus) if len(corpus) else 0.0
+        # Length norm of each document: k1 * (1 - b + b * dl / avgdl)
+        # (avgdl is 0 only when every document is empty, then dl / avgdl is taken as 0)
+        norms = [k1 * (1 - b + b * dl / avgdl) if avgdl > 0 else k1 * (1 - b)
+                 for dl in corpus.doc_lengths]
+
+        # Arrays indexed by the term ids of the corpus
+        self.terms = corpus.terms
+        impacts = [array('d') for _ in range(len(corpus.terms))]
+        for doc, (doc_terms, doc_tfs) in enumerate(corpus.tf):
+            for t, tf in zip(doc_terms, doc_tfs):
+                impacts[t].append(tf * (k1 + 1) / (tf + norms[doc]))
+        self.postings = list(zip(corpus.postings, impacts)) # term id -> (doc numbers, impacts)
+        self.max_impacts = array('d', (max(values, default=0.0) for values in impacts)) # upper bounds for top-k
+
+# Function to get the BM25 impacts of the shared corpus (computed once per collection)
+def load_bm25(k1=BM25_K1, b=BM25_B):
+    corpus = get_corpus()
+    return corpus.cached(('bm25', k1, b), lambda: BM25Index(corpus, k1, b))
+
+# Function to rank with BM25, same interface as rank_documents
+def rank_bm25(query_terms, bm25, total_docs_N, relevant_counts, R, k=None):
+    term_weights = []
+    for term, qtf in Counter(query_terms).items():
+        t = bm25.terms.find(term)
+        if t >= 0:
+            docs, impacts = bm25.postings[t]
+            weight = max(term_weight(len(docs), relevant_counts[term], total_docs_N, R), 0.0) * qtf
+            term_weights.append((t, docs, impacts, weight))
+
+    if k is not None:
+        cursors = [TermCursor(docs, impacts, weight, bm25.max_impacts[t], order)
+                   for order, (t, docs, impacts, weight) in enumerate(term_weights)]
+        with stage('bm25.top_k'):
+            return max_score_top_k(cursors, k)
+
+    # Single pass over the postings of the query terms
+    with stage('bm25.score'):
+        scores = {}
+        for _, docs, impacts, weight in term_weights:
+            count('bm25.postings_read', len(docs))
+            for doc, impact in zip(docs, impacts):
+                scores[doc] = scores.get(doc, 0.0) + weight * impact
+
+    with stage('bm25.sort'):
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+# Function to resolve a query, with the probabilistic method (binary independence or BM25)
+def resolve_query(collection, bm25=None):
+    processed_files, postings = collection
     if not processed_files:
         print("Error: No processed files (.rep) found in 'processed' directory.")
         return
 
-    docs_index = {}
     total_docs_N = len(processed_files)
 
-    for fname in processed_files:
-        path = os.path.join(PROCESSED_DIR, fname)
-        content = read_file(path)
-        terms = set(content.split()) 
-        docs_index[fname] = terms
-
     # The user insert the query
     raw_query = input("\nInsert the query: ").strip()
     query_terms = [normalize_term(t) for t in raw_query.split()]
@@ -101,8 +185,12 @@ def resolve_query():
         print("Empty query.")
         return
 
+    # Documents of each query term, to update r_t when a document is marked
+    query_postings = {term: set(postings.get(term, ())) for term in query_terms}
+
     # Inicialization of relevant variables
     relevant_docs_marked = set() 
+    relevant_counts = Counter() # r_t: known relevant documents containing the term
     
     # Feedback Loop
     iteration = 0
@@ -115,27 +203,16 @@ def resolve_query():
         # R: Total known relevant documents
         R = len(relevant_docs_marked)
         
-        scores = []
-
-        for doc_name, doc_terms in docs_index.items():
-            rsv = 0.0 
-            
-            for term in query_terms:
-                if term in doc_terms: 
-                    n_t = sum(1 for d in docs_index.values() if term in d)
-                    r_t = sum(1 for d_name in relevant_docs_marked if term in docs_index[d_name])
-
-                    # w = log( (r_t + 0.5) / (R - r_t + 0.5) / ((n_t - r_t + 0.5) / (N - n_t - R + r_t + 0.5)) )
-                    numerator = (r_t + 0.5) / (R - r_t + 0.5)
-                    denominator = (n_t - r_t + 0.5) / (total_docs_N - n_t - R + r_t + 0.5)
-                    
-                    weight = math.log(numerator / denominator)
-                    rsv += weight
-            
-            scores.append((doc_name, rsv))
+        if bm25 is not None:
+            ranking = rank_bm25(query_terms, bm25, total_docs_N, relevant_counts, R, MENU_RESULTS)
+        else:
+            ranking = rank_documents(query_terms, postings, total_docs_N, relevant_counts, R, MENU_RESULTS)
+        scores = [(processed_files[doc], score) for doc, score in ranking]
 
-        # Show results
-        scores.sort(key=lambda x: x[1], reverse=True)
+        # Show results (documents without any query term are not listed)
+        if not scores:
+            print("No documents matched your query.")
+            return
 
         for idx, (doc, score) in enumerate(scores):
             marker = "[REL]" if doc in relevant_docs_marked else ""
@@ -156,9 +233,12 @@ def resolve_query():
             
             for i in indices:
                 if 1 <= i <= len(scores):
-                    doc_name = scores[i-1][0]
+                    doc, doc_name = ranking[i-1][0], scores[i-1][0]
                     if doc_name not in relevant_docs_marked:
                         relevant_docs_marked.add(doc_name)
+                        for term, docs in query_postings.items():
+                            if doc in docs:
+                                relevant_counts[term] += 1
                         new_relevance_found = True
                         print(f" -> Marked as relevant: {doc_name}")
                 else:
@@ -173,12 +253,15 @@ def resolve_query():
 
 # Function for main
 def main():
+    collection = None
+
     while True:
         print("\n=== PROBABILISTIC MODEL MENU ===")
         print("a) List the documents.")
         print("b) Show a document (.txt).")
         print("c) Show a document (.rep).")
         print("d) Solve a query.")
+        print("e) Solve a query with BM25 (term frequencies and document lengths).")
         print("f) Exit")
 
         choice = input("Select an option: ").lower().strip()
@@ -193,7 +276,14 @@ def main():
             menu_show_normalized()
 
         elif choice == 'd':
-            resolve_query()
+            if collection is None:
+                collection = load_collection()
+            resolve_query(collection)
+
+        elif choice == 'e':
+            if collection is None:
+                collection = load_collection()
+            resolve_query(collection, load_bm25())
 
         elif choice == 'f':
             print("Exiting...")
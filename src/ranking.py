@@ -0,0 +1,123 @@
+import heapq
+from bisect import bisect_left
+
+# Slack used when comparing upper bounds with the threshold, so that rounding in
+# the partial sums can never prune a document that exhaustive scoring would keep.
+PRUNE_SLACK = 1e-9
+
+# Function to select the best k (doc, score) pairs with a bounded heap.
+# Ties are broken by the smaller doc id, like a stable sort in doc order.
+def top_k(scores, k):
+    return heapq.nsmallest(k, scores, key=lambda x: (-x[1], x[0]))
+
+class TermCursor:
+    """
+    Cursor over the postings of one query term (doc ids sorted ascending).
+    The contribution of a posting to the score is scale * weights[i]; with weights=None
+    every document of the term contributes 'scale' (e.g. binary-independence weights).
+    'max_weight' is the largest weight of the list, precomputed with the index.
+    """
+    __slots__ = ('doc_ids', 'weights', 'scale', 'upper_bound', 'order', 'pos')
+
+    def __init__(self, doc_ids, weights, scale, max_weight, order):
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.scale = scale
+        # Only positive contributions can raise a score above the threshold
+        self.upper_bound = max(scale * max_weight, 0.0)
+        self.order = order
+        self.pos = 0
+
+    def doc(self):
+        return self.doc_ids[self.pos] if self.pos < len(self.doc_ids) else None
+
+    def score(self):
+        if self.weights is None:
+            return self.scale
+        return self.scale * self.weights[self.pos]
+
+    def advance(self, target):
+        # First posting with doc id >= target (binary search from the current position)
+        self.pos = bisect_left(self.doc_ids, target, self.pos)
+
+def max_score_top_k(cursors, k, min_score=None):
+    """
+    MaxScore dynamic pruning. Returns the same top-k as exhaustive scoring, as a list of
+    (doc, score) sorted by score (ties: smaller doc first). Documents are only kept if their
+    score is > min_score (when given).
+
+    Terms are sorted by upper bound. Once the heap is full, the terms whose bounds add up
+    to no more than the k-th score are "non-essential": a document that only contains them
+    cannot enter the top-k, so candidates come from the essential lists only, and the
+    non-essential lists are probed (by binary search) while the document can still make it.
+    Scores are summed in the query term order ('order'), so they are bit-identical to the
+    term-at-a-time accumulation.
+    """
+    if k <= 0:
+        return []
+
+    cursors = sorted(cursors, key=lambda c: c.upper_bound)
+    prefix = []
+    total = 0.0
+    for cursor in cursors:
+        total += cursor.upper_bound
+        prefix.append(total)
+
+    heap = [] # (score, -doc): the root is the worst document of the top-k
+    first_essential = 0
+
+    while True:
+        if len(heap) == k:
+            threshold = heap[0][0] if min_score is None else max(heap[0][0], min_score)
+        else:
+            threshold = min_score
+
+        if threshold is not None:
+            while first_essential < len(cursors) and prefix[first_essential] + PRUNE_SLACK <= threshold:
+                first_essential += 1
+
+        essential = cursors[first_essential:]
+        candidates = [c.doc() for c in essential if c.doc() is not None]
+        if not candidates:
+            break
+        doc = min(candidates)
+
+        contributions = []
+        partial = 0.0
+        for cursor in essential:
+            if cursor.doc() == doc:
+                value = cursor.score()
+                contributions.append((cursor.order, value))
+                partial += value
+                cursor.pos += 1
+
+        pruned = False
+        for i in range(first_essential - 1, -1, -1):
+            if threshold is not None and partial + prefix[i] + PRUNE_SLACK <= threshold:
+                pruned = True
+                break
+            cursor = cursors[i]
+            cursor.advance(doc)
+            if cursor.doc() == doc:
+                value = cursor.score()
+                contributions.append((cursor.order, value))
+                partial += value
+
+        if pruned:
+            continue
+
+        contributions.sort()
+        score = 0.0
+        for _, value in contributions:
+            score += value
+
+        if min_score is not None and score <= min_score:
+            continue
+
+        entry = (score, -doc)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    return sorted(((-neg_doc, score) for score, neg_doc in heap), key=lambda x: (-x[1], x[0]))
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import runpy
+import asyncio
+import argparse
+from bisect import bisect_left
+from collections import Counter, deque
+
+from normalization import normalize_term
+from instrumentation import stage
+from indexing import load_index
+from impacts import ImpactIndex, DEFAULT_BUDGET_MS
+
+# Server configuration
+HOST = '127.0.0.1'
+PORT = 8765
+DEFAULT_K = 10
+LATENCY_WINDOW = 10000 # Latencies kept per model for the stats request
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Protocol: one JSON object per line in each direction. Requests can be pipelined
+# (sent without waiting for the answers); the answers come back in the same order
+# and carry the request "id".
+#   {"id": 1, "model": "boolean", "query": "(a OR b) AND NOT c"}
+#   {"id": 2, "model": "vector", "query": "a b", "k": 10}
+#   {"id": 3, "model": "probabilistic", "query": "a b", "k": 10, "relevant": ["file01.rep"]}
+#   {"id": 4, "model": "bm25", "query": "a b", "k": 10, "relevant": []}
+#   {"id": 5, "model": "impact", "query": "a b", "k": 10, "budget_ms": 20}
+#   {"id": 6, "op": "stats"}
+# Answers: {"id": 1, "results": [...], "latency_ms": 0.12} or {"id": 1, "error": "..."}
+# Impact answers also carry "complete", "safe" and "bound" (see impacts.py).
+
+# Function to load a model script (their names have dashes, so they are not importable)
+def load_model(script_name):
+    return runpy.run_path(os.path.join(SRC_DIR, script_name), run_name='model')
+
+def contains(postings, doc):
+    pos = bisect_left(postings, doc)
+    return pos < len(postings) and postings[pos] == doc
+
+def check_request(request):
+    # Types of the optional fields, so a malformed request gets an error answer
+    if not isinstance(request.get('query', ''), str):
+        raise ValueError("'query' must be a string.")
+    k = request.get('k', DEFAULT_K)
+    if isinstance(k, bool) or not isinstance(k, int) or k <= 0:
+        raise ValueError("'k' must be a positive integer.")
+    budget_ms = request.get('budget_ms', DEFAULT_BUDGET_MS)
+    if isinstance(budget_ms, bool) or not isinstance(budget_ms, (int, float)) or budget_ms < 0:
+        raise ValueError("'budget_ms' must be a non-negative number.")
+    relevant = request.get('relevant', [])
+    if not isinstance(relevant, list) or not all(isinstance(name, str) for name in relevant):
+        raise ValueError("'relevant' must be a list of file names.")
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+class QueryService:
+    """Loads the three models once and answers queries against the resident data."""
+    def __init__(self):
+        boolean = load_model('boolean-model.py')
+        self.compile_query = boolean['compile_query']
+        self.index = load_index()
+
+        vector = load_model('vector-model.py')
+        self.engine = vector['SearchEngine']()
+        self.engine.load_documents()
+        self.impact_index = ImpactIndex.from_engine(self.engine)
+
+        probabilistic = load_model('probabilistic.py')
+        self.rank_documents = probabilistic['rank_documents']
+        self.rank_bm25 = probabilistic['rank_bm25']
+        self.bm25 = probabilistic['load_bm25']()
+        self.doc_names, self.postings = probabilistic['load_collection']()
+        self.doc_numbers = {name: doc for doc, name in enumerate(self.doc_names)}
+
+        self.handlers = {
+            'boolean': self.boolean_query,
+            'vector': self.vector_query,
+            'probabilistic': self.probabilistic_query,
+            'bm25': self.bm25_query,
+            'impact': self.impact_query,
+        }
+        self.latencies = {model: deque(maxlen=LATENCY_WINDOW) for model in self.handlers}
+
+    def boolean_query(self, request):
+        plan = self.compile_query(request.get('query', ''))
+        with stage('boolean.evaluate'):
+            return [self.index.doc_map[doc_id] for doc_id in plan.evaluate(self.index)]
+
+    def vector_query(self, request):
+        query_vec = self.engine.get_query_vector(request.get('query', ''))
+        return self.engine.search(query_vec, request.get('k', DEFAULT_K))
+
+    def probabilistic_query(self, request, bm25=False):
+        query_terms = [normalize_term(t) for t in request.get('query', '').split()]
+        query_terms = [t for t in query_terms if t]
+
+        # r_t from the documents the client already judged as relevant
+        relevant = [self.doc_numbers[name] for name in request.get('relevant', [])
+                    if name in self.doc_numbers]
+        relevant_counts = Counter()
+        for term in set(query_terms):
+            docs = self.postings.get(term, ())
+            relevant_counts[term] = sum(1 for doc in relevant if contains(docs, doc))
+
+        k = request.get('k', DEFAULT_K)
+        if bm25:
+            ranking = self.rank_bm25(query_terms, self.bm25, len(self.doc_names),
+                                     relevant_counts, len(relevant), k)
+        else:
+            ranking = self.rank_documents(query_terms, self.postings, len(self.doc_names),
+                                          relevant_counts, len(relevant), k)
+        return [(self.doc_names[doc], score) for doc, score in ranking]
+
+    def bm25_query(self, request):
+        return self.probabilistic_query(request, bm25=True)
+
+    def impact_query(self, request):
+        # Score-at-a-time over the impact-ordered VSM postings, stopped by the time budget
+        query_vec = self.engine.get_query_vector(request.get('query', ''))
+        results, info = self.impact_index.search(query_vec, request.get('k', DEFAULT_K),
+                                                 request.get('budget_ms', DEFAULT_BUDGET_MS))
+        return {'results': results, 'complete': info['complete'], 'safe': info['safe'],
+                'bound': info['bound']}
+
+    def stats(self):
+        report = {}
+        for model, latencies in self.latencies.items():
+            if latencies:
+                report[model] = {
+                    'requests': len(latencies),
+                    'p50_ms': percentile(latencies, 50),
+                    'p99_ms': percentile(latencies, 99),
+                }
+        return report
+
+    def answer(self, line):
+        # Returns the encoded answer to one request line
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("The request must be a JSON object.")
+            request_id = request.get('id')
+
+            if request.get('op') == 'stats':
+                response = {'id': request_id, 'stats': self.stats()}
+            else:
+                model = request.get('model')
+                if model not in self.handlers:
+                    raise ValueError(f"Unknown model '{model}'.")
+                check_request(request)
+                results = self.handlers[model](request)
+                details = results if isinstance(results, dict) else {'results': results}
+                latency = (time.perf_counter() - start) * 1000
+                self.latencies[model].append(latency)
+                response = {'id': request_id, **details, 'latency_ms': round(latency, 3)}
+
+        except (ValueError, TypeError) as e:
+            response = {'id': request_id, 'error': str(e)}
+
+        return (json.dumps(response) + '\n').encode('utf-8')
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(self.answer(line))
+                    # Only waits when the client is not reading its answers
+                    await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(service.handle_client, host, port)
+    print(f"Query server listening on {host}:{port} (one JSON request per line).")
+    print("Press Ctrl+C to stop.")
+    async with server:
+        await server.serve_forever()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query server with the models held in memory.")
+    parser.add_argument('--host', default=HOST, help="Address to listen on (default: localhost).")
+    parser.add_argument('--port', type=int, default=PORT, help="Port to listen on.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    print("Loading the models...")
+    service = QueryService()
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+    finally:
+        service.index.close_segment()
+        for model, report in service.stats().items():
+            print(f"{model}: {report['requests']} requests, "
+                  f"p50 {report['p50_ms']:.3f} ms, p99 {report['p99_ms']:.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from indexing import InvertedIndex, write_segment
+from normalization import tokenize, load_query_stopwords
+from ranking import top_k
+
+# Configuration Paths
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSED_DIR = os.path.join(BASE_DIR, 'processed')
+SHARDS_DIR = os.path.join(PROCESSED_DIR, 'shards')
+GLOBAL_STATS_FILE = os.path.join(SHARDS_DIR, 'global.json')
+DEFAULT_SHARDS = 4
+
+# Sharded index: the .rep files are split into N shards (by a hash of the file name, so
+# a document always lands in the same shard). Every shard is an ordinary index segment
+# with its own doc ids and local statistics; the coordinator only keeps the global
+# document count and DF of every term, merged from the shards.
+# Queries are scored with tf-idf cosine using the global IDF: each shard returns its own
+# top-k and the coordinator merges them, which gives the same top-k as a single index.
+# Documents and queries go through the tokenizer of the vector model (no stop-words, no
+# numbers), so the shards index the same vocabulary as its SearchEngine.
+
+def shard_of(filename, n_shards):
+    return zlib.crc32(filename.encode('utf-8')) % n_shards
+
+def shard_path(shard):
+    return os.path.join(SHARDS_DIR, f'shard-{shard:03d}.seg')
+
+def _tokenized_counts(documents, stopwords):
+    for filename, counts, stat in documents:
+        tokens = Counter()
+        for term, tf in counts.items():
+            for token in tokenize(term, stopwords):
+                tokens[token] += tf
+        yield filename, tokens, stat
+
+def _build_shard(shard, path, files):
+    # Builds and saves one shard to path; returns its local statistics (documents, {term: df})
+    index = InvertedIndex()
+    index.build_from_counts(_tokenized_counts(index.read_counts(files), load_query_stopwords()))
+    write_segment(path, index)
+    return shard, len(index.doc_map), dict(zip(index.vocab_list, index.store.dfs))
+
+# Function to build every shard (in parallel) and merge the global statistics
+def build_shards(n_shards=DEFAULT_SHARDS, workers=None):
+    if not os.path.exists(PROCESSED_DIR):
+        print(f"Error: The directory does not exits: {PROCESSED_DIR}")
+        return False
+
+    files = sorted(f for f in os.listdir(PROCESSED_DIR) if f.endswith('.rep'))
+    if not files:
+        print("No .rep files in the directory 'processed'.")
+        return False
+
+    assignment = defaultdict(list)
+    for filename in files:
+        assignment[shard_of(filename, n_shards)].append(filename)
+
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+    for shard in range(n_shards):
+        if shard not in assignment and os.path.exists(shard_path(shard)):
+            os.remove(shard_path(shard))
+
+    print(f"Building {n_shards} shards from {len(files)} documents...")
+    start = time.perf_counter()
+    total_docs = 0
+    df = Counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_build_shard, shard, shard_path(shard), shard_files)
+                   for shard, shard_files in sorted(assignment.items())]
+        for future in futures:
+            shard, n_docs, shard_df = future.result()
+            total_docs += n_docs
+            df.update(shard_df)
+            print(f" -> Shard {shard}: {n_docs} documents, {len(shard_df)} terms")
+
+    stats = {'shards': n_shards, 'documents': total_docs, 'df': dict(sorted(df.items()))}
+    tmp_path = GLOBAL_STATS_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stats, f)
+    os.replace(tmp_path, GLOBAL_STATS_FILE)
+
+    print(f"Shards built in {time.perf_counter() - start:.2f} s ({len(df)} terms in total).")
+    return True
+
+# Shard side of the queries. Every worker process opens the shards it is asked for once,
+# and computes their document norms with the global IDF.
+def _init_searcher(idf):
+    global _worker_idf, _worker_shards
+    _worker_idf = idf
+    _worker_shards = {}
+
+def _open_shard(shard):
+    if shard not in _worker_shards:
+        index = InvertedIndex()
+        if not index.load_index(shard_path(shard)):
+            raise ValueError(f"Shard {shard} could not be loaded.")
+
+        norms = defaultdict(float)
+        for idx, term in enumerate(index.vocab_list):
+            idf = _worker_idf[term]
+            for doc, tf in index.segment.postings(idx).items():
+                norms[doc] += (tf * idf) ** 2
+        norms = {doc: math.sqrt(value) for doc, value in norms.items()}
+        _worker_shards[shard] = (index, norms)
+
+    return _worker_shards[shard]
+
+def _search_shard(shard, query_vec, k):
+    # Top-k (filename, dot product with the normalized documents) of one shard
+    index, norms = _open_shard(shard)
+    accumulators = defaultdict(float)
+    for term, q_weight in query_vec.items():
+        # A term of every document (idf 0) adds nothing, and a document whose terms all
+        # have idf 0 has norm 0: both are skipped, as in the single index
+        if q_weight == 0 or term not in index.index:
+            continue
+        idf = _worker_idf[term]
+        for doc, tf in index.index[term].items():
+            norm = norms.get(doc, 0.0)
+            if norm > 0:
+                accumulators[doc] += q_weight * (tf * idf) / norm
+
+    scores = [(doc, acc) for doc, acc in accumulators.items() if acc > 0]
+    return [(index.doc_map[doc], acc) for doc, acc in top_k(scores, k)]
+
+class ShardedSearch:
+    """Coordinator: global statistics plus a process pool that holds the shards."""
+    def __init__(self, workers=None):
+        with open(GLOBAL_STATS_FILE, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+
+        N = stats['documents']
+        self.shards = [s for s in range(stats['shards']) if os.path.exists(shard_path(s))]
+        self.idf = {term: math.log10(N / df) for term, df in stats['df'].items()}
+        self.n_docs = N
+        self.stopwords = load_query_stopwords()
+
+        workers = workers or min(len(self.shards), os.cpu_count() or 1)
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_searcher,
+                                            initargs=(self.idf,))
+        else:
+            # Single process: the shards are searched one after another in this process
+            self.pool = None
+            _init_searcher(self.idf)
+
+    def query_vector(self, query_str):
+        tf_q = Counter(tokenize(query_str, self.stopwords))
+        return {term: tf_q[term] * self.idf[term] for term in sorted(tf_q) if term in self.idf}
+
+    def search(self, query_str, k=10):
+        # Scatter the query to the shards, gather and merge their top-k
+        query_vec = self.query_vector(query_str)
+        norm_q = math.sqrt(sum(w ** 2 for w in query_vec.values()))
+        if norm_q == 0:
+            return []
+
+        if self.pool is not None:
+            futures = [self.pool.submit(_search_shard, shard, query_vec, k) for shard in self.shards]
+            partial = [future.result() for future in futures]
+        else:
+            partial = [_search_shard(shard, query_vec, k) for shard in self.shards]
+
+        merged = [(name, acc / norm_q) for results in partial for name, acc in results]
+        return top_k(merged, k)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+# Functions for the menu
+def load_search(searcher):
+    if searcher is not None:
+        return searcher
+    if not os.path.exists(GLOBAL_STATS_FILE):
+        print("Error: There are no shards. Build them first.")
+        return None
+    return ShardedSearch()
+
+def resolve_query(searcher, k=10):
+    query_str = input("\nInsert the query: ").strip()
+    start = time.perf_counter()
+    results = searcher.search(query_str, k)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if not results:
+        print("No documents matched your query.")
+    for i, (doc, score) in enumerate(results):
+        print(f"[{i+1}] {doc} (Sim: {score:.4f})")
+    print(f"({len(searcher.shards)} shards, {elapsed:.2f} ms)")
+
+def print_menu():
+    print("\n=== SHARDED INDEX ===")
+    print("a) Build the shards")
+    print("b) Resolve a query (scatter-gather over the shards)")
+    print("c) Show the global statistics")
+    print("d) Exit")
+
+def main():
+    searcher = None
+
+    while True:
+        print_menu()
+        choice = input("Choose an option: ").strip().lower()
+
+        if choice == 'a':
+            value = input(f"Number of shards [{DEFAULT_SHARDS}]: ").strip()
+            if searcher is not None:
+                searcher.close()
+                searcher = None
+            build_shards(int(value) if value.isdigit() and int(value) > 0 else DEFAULT_SHARDS)
+
+        elif choice == 'b':
+            searcher = load_search(searcher)
+            if searcher is not None:
+                resolve_query(searcher)
+
+        elif choice == 'c':
+            searcher = load_search(searcher)
+            if searcher is not None:
+                print(f"\n{len(searcher.shards)} shards, {searcher.n_docs} documents, "
+                      f"{len(searcher.idf)} terms.")
+
+        elif choice == 'd':
+            if searcher is not None:
+                searcher.close()
+            print("Exiting...")
+            break
+
+        else:
+            print("Invalid option.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sharded index (interactive menu by default).")
+    parser.add_argument('--build', type=int, metavar='N',
+                        help="Split the collection into N shards and build them, without the menu.")
+    parser.add_argument('--query', help="Resolve a query over the shards, without the menu.")
+    parser.add_argument('--k', type=int, default=10, help="Results of the query.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.build:
+        sys.exit(0 if build_shards(args.build, args.workers) else 1)
+    elif args.query is not None:
+        if not os.path.exists(GLOBAL_STATS_FILE):
+            print("Error: There are no shards. Build them first.")
+            sys.exit(1)
+        searcher = ShardedSearch(args.workers)
+        for doc, score in searcher.search(args.query, args.k):
+            print(f"{doc}\t{score:.6f}")
+        searcher.close()
+    else:
+        main()
@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+# Term dictionary: the sorted vocabulary mapped to dense integer ids (id = rank of the
+# term), so the models can keep their per-term data in arrays indexed by term id.
+#
+# The terms are front-coded in blocks of BLOCK_TERMS: each entry is
+#   shared prefix length (with the previous term) | suffix length | suffix bytes
+# with both lengths in variable-byte encoding, and the first term of every block stored
+# whole (shared prefix 0). A lookup binary-searches the first terms of the blocks and
+# decodes a single block. The same two arrays are written to the index segment.
+BLOCK_TERMS = 16
+
+def _put_varint(data, value):
+    while value >= 0x80:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+def _get_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+class TermDictionary(Sequence):
+    """Sorted terms <-> ids 0..n-1 ('offsets' and 'data' can be memoryviews over a segment)."""
+    def __init__(self, n_terms, offsets, data):
+        self.n_terms = n_terms
+        self.offsets = offsets # block -> start in data (block + 1 -> end)
+        self.data = data
+        self.cached_block = -1
+        self.cached_keys = None
+
+    @classmethod
+    def from_sorted(cls, terms):
+        offsets = array('Q')
+        data = bytearray()
+        previous = b''
+        n_terms = 0
+        for term in terms:
+            key = term.encode('utf-8')
+            prefix = 0
+            if n_terms % BLOCK_TERMS == 0:
+                offsets.append(len(data))
+            else:
+                limit = min(len(previous), len(key))
+                while prefix < limit and previous[prefix] == key[prefix]:
+                    prefix += 1
+            _put_varint(data, prefix)
+            _put_varint(data, len(key) - prefix)
+            data += key[prefix:]
+            previous = key
+            n_terms += 1
+        offsets.append(len(data))
+        return cls(n_terms, offsets, bytes(data))
+
+    def copy(self):
+        # Independent of the segment the dictionary was read from
+        return TermDictionary(self.n_terms, array('Q', self.offsets), bytes(self.data))
+
+    def block(self, block):
+        # utf-8 keys of a block (the last decoded block is kept)
+        if block != self.cached_block:
+            data = self.data
+            pos, end = self.offsets[block], self.offsets[block + 1]
+            keys = []
+            previous = b''
+            while pos < end:
+                prefix, pos = _get_varint(data, pos)
+                length, pos = _get_varint(data, pos)
+                previous = previous[:prefix] + bytes(data[pos:pos + length])
+                keys.append(previous)
+                pos += length
+            self.cached_block = block
+            self.cached_keys = keys
+        return self.cached_keys
+
+    def first_key(self, block):
+        pos = self.offsets[block]
+        _, pos = _get_varint(self.data, pos)
+        length, pos = _get_varint(self.data, pos)
+        return bytes(self.data[pos:pos + length])
+
+    def find(self, term):
+        # Id of the term, -1 if it is not in the dictionary (utf-8 order == code point order)
+        key = term.encode('utf-8')
+        lo, hi = 0, len(self.offsets) - 2
+        if hi < 0:
+            return -1
+        # Last block whose first term is <= key
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.first_key(mid) <= key:
+                lo = mid
+            else:
+                hi = mid - 1
+
+        keys = self.block(lo)
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return lo * BLOCK_TERMS + i
+        return -1
+
+    def __len__(self):
+        return self.n_terms
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('term id out of range')
+        return self.block(idx // BLOCK_TERMS)[idx % BLOCK_TERMS].decode('utf-8')
+
+    def __contains__(self, term):
+        return isinstance(term, str) and self.find(term) >= 0
+
+    def __iter__(self):
+        for block in range(len(self.offsets) - 1):
+            for key in self.block(block):
+                yield key.decode('utf-8')
+
+    def nbytes(self):
+        return len(self.offsets) * self.offsets.itemsize + len(self.data)
+
+class TermMap(Mapping):
+    """Read-only {term: value} view over a sequence indexed by term id (None: no value)."""
+    def __init__(self, terms, values):
+        self.terms = terms
+        self.values = values
+
+    def __getitem__(self, term):
+        t = self.terms.find(term) if isinstance(term, str) else -1
+        if t < 0 or self.values[t] is None:
+            raise KeyError(term)
+        return self.values[t]
+
+    def __iter__(self):
+        return (term for term, value in zip(self.terms, self.values) if value is not None)
+
+    def __len__(self):
+        return sum(1 for value in self.values if value is not None)
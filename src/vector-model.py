@@ -1,10 +1,20 @@
 import os
-import re
-import unicodedata
 import math
+import heapq
 import sys
+import json
+import argparse
+from array import array
+from itertools import islice
+from contextlib import redirect_stdout
 from collections import defaultdict, Counter
 
+from normalization import tokenize, load_query_stopwords
+from corpus import get_corpus, read_document
+from instrumentation import stage, count
+from ranking import TermCursor, max_score_top_k, top_k
+from terms import TermDictionary
+
 # Configuration Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
@@ -15,190 +25,289 @@ STOPWORDS_FILE = os.path.join(DATA_DIR, 'stopwords.txt')
 ALPHA = 1.0 # Original query weight
 BETA = 0.75 # Relevant documents weight
 GAMMA = 0.15 # Non-relevant documents weight
+ROCCHIO_TOP_M = None # Expansion terms kept after feedback (None: all of them)
 
-# Function dor read the files
-def read_file(filepath):
-    try:
-        with open(filepath, 'r', encoding = 'utf-8') as f:
-            return f.read()
-        
-    except UnicodeDecodeError:
-        with open(filepath, 'r', encoding = 'iso-8859-1') as f:
-            return f.read()
-        
-    except FileNotFoundError:
-        return None
-
-# Function for normalize the terms
-def remove_accents(text):
-    nfkd_form = unicodedata.normalize('NFD', text)
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-
-def normalize_term(term):
-    term = term.lower().strip()
-    term = remove_accents(term)
-    term = re.sub(r'[^\w\s]', '', term)
-    return term
-
-def load_stopwords():
-    stops = set()
-    if os.path.exists(STOPWORDS_FILE):
-        content = read_file(STOPWORDS_FILE)
-        if content:
-            # Assumes stopwords are separated by newlines or spaces
-            for word in content.split():
-                stops.add(normalize_term(word))
-    
-    return stops
-
-def tokenize(text, stopwords):
-    words = text.split()
-    tokens = []
-    for w in words:
-        norm = normalize_term(w)
-        if norm and norm not in stopwords and not norm.isnumeric():
-            tokens.append(norm)
+# Results listed by the menu (best first, selected with MaxScore pruning)
+MENU_RESULTS = 10
 
-    return tokens
+# Batch search
+BATCH_QUERIES = 1000 # Queries scored together (bounds the accumulators kept in memory)
 
 # Vector Space Model Logic
 class SearchEngine:
+    # Terms are numbered by the term dictionary (sorted vocabulary, see terms.py) and
+    # documents by file name order; the per-term and per-document data are lists and
+    # arrays indexed by those numbers.
     def __init__(self):
-        self.documents = {} # {filename: content}
-        self.doc_tokens = {} # {filename: [tokens]}
-        self.vocab = sorted([]) 
-        self.tf = {} # {filename: {term: freq}}
-        self.idf = {} # {term: idf_val}
-        self.weights = {} # {filename: {term: tf-idf}}
-        self.stopwords = load_stopwords()
+        self.vocab = TermDictionary.from_sorted([]) # term <-> term id
+        self.tf = [] # doc number -> (term ids, freqs), sorted by term id
+        self.idf = array('d') # term id -> idf
+        self.weights = [] # doc number -> (term ids, tf-idf weights), sparse: only non-zero weights
+        self.postings = [] # term id -> (doc numbers, tf-idf / |d|), None if every weight is zero
+        self.max_weights = array('d') # term id -> largest tf-idf / |d| of its postings, upper bounds for top-k
+        self.doc_norms = array('d') # doc number -> |d|
+        self.doc_rank = {} # {filename: doc number (file name order)}, also used to break score ties
+        self.doc_names = [] # doc number -> filename
+        self.stopwords = load_query_stopwords()
 
     def load_documents(self):
-        # Reads all rep files from PROCESSED_DIR.
-        if not os.path.exists(PROCESSED_DIR):
-            print(f"Error: Directory {PROCESSED_DIR} does not exist.")
-            return
-
-        files = [f for f in os.listdir(PROCESSED_DIR) if f.endswith('.rep')]
-        if not files:
-            print("No .rep files found in data directory.")
+        # Term counts come from the shared corpus (processed/*.rep, read once per process)
+        corpus = get_corpus()
+        if not corpus.doc_names:
+            print("No .rep files found in the 'processed' directory.")
             return
 
-        print(f"Loading {len(files)} documents...")
-        all_terms = set()
+        print(f"Loading {len(corpus)} documents...")
+        # Tokens of every corpus term, with the same filter as the queries (once per term)
+        tokens = [tokenize(term, self.stopwords) for term in corpus.terms]
 
-        for filename in files:
-            path = os.path.join(PROCESSED_DIR, filename)
-            content = read_file(path)
-            self.documents[filename] = content
-            
-            # Tokenize
-            tokens = tokenize(content, self.stopwords)
-            self.doc_tokens[filename] = tokens
-            
+        counts = []
+        for doc_terms, doc_tfs in corpus.tf:
             # Calculate TF (Raw Frequency)
-            term_counts = Counter(tokens)
-            self.tf[filename] = term_counts
-            all_terms.update(term_counts.keys())
+            term_counts = Counter()
+            for t, count in zip(doc_terms, doc_tfs):
+                for token in tokens[t]:
+                    term_counts[token] += count
+            counts.append(term_counts)
+
+        self.set_counts(corpus.doc_names, counts)
+
+    def set_counts(self, doc_names, counts):
+        # Term dictionary and TF arrays from the {term: freq} counts of every document
+        self.doc_names = list(doc_names)
+        self.doc_rank = {filename: rank for rank, filename in enumerate(self.doc_names)}
+        self.vocab = TermDictionary.from_sorted(sorted(set().union(*counts)))
+        term_ids = {term: t for t, term in enumerate(self.vocab)} # Only while the arrays are built
+
+        self.tf = []
+        for term_counts in counts:
+            terms = sorted(term_counts)
+            self.tf.append((array('I', (term_ids[term] for term in terms)),
+                            array('I', (term_counts[term] for term in terms))))
 
-        self.vocab = sorted(list(all_terms))
         self.calculate_weights()
 
     def calculate_weights(self):
-        """Calculates TF-IDF for all documents."""
-        N = len(self.documents)
+        """Calculates TF-IDF for all documents, plus the postings and norms used by search."""
+        N = len(self.doc_names)
         
-        # Calculate IDF
-        for term in self.vocab:
-            # df: number of docs containing the term
-            df = sum(1 for f in self.documents if term in self.tf[f])
-            self.idf[term] = math.log10(N / df) if df > 0 else 0
+        # Calculate IDF (df: number of docs containing the term)
+        df = array('I', bytes(len(self.vocab) * 4))
+        for doc_terms, _ in self.tf:
+            for t in doc_terms:
+                df[t] += 1
+
+        self.idf = array('d', (math.log10(N / n) if n > 0 else 0 for n in df))
 
         # Calculate TF-IDF Weights
-        for filename in self.documents:
-            self.weights[filename] = {}
-            for term in self.vocab:
-                tf_val = self.tf[filename].get(term, 0)
+        self.weights = []
+        self.doc_norms = array('d')
+        self.postings = [None] * len(self.vocab)
+        for rank, (doc_terms, doc_tfs) in enumerate(self.tf):
+            term_ids = array('I')
+            doc_weights = array('d')
+            norm = 0.0
+            # Only the terms of the document (in vocabulary order) can have a non-zero weight
+            for t, tf_val in zip(doc_terms, doc_tfs):
                 # Standard TF*IDF. 
                 # Note: Some implementations use (1+log(tf)), but prompts usually imply raw tf * idf
-                w = tf_val * self.idf[term]
-                self.weights[filename][term] = w
+                w = tf_val * self.idf[t]
+                if w == 0:
+                    continue
+
+                term_ids.append(t)
+                doc_weights.append(w)
+                norm += w ** 2
+
+            norm = math.sqrt(norm)
+            self.weights.append((term_ids, doc_weights))
+            self.doc_norms.append(norm)
+
+            # Postings hold the weights already divided by the document norm
+            for t, w in zip(term_ids, doc_weights):
+                if self.postings[t] is None:
+                    self.postings[t] = (array('I'), array('d'))
+                doc_numbers, normalized = self.postings[t]
+                doc_numbers.append(rank)
+                normalized.append(w / norm)
+
+        self.max_weights = array('d', (max(p[1]) if p is not None else 0.0 for p in self.postings))
+
+    def term_id(self, term):
+        # Term id of a term with postings (-1 if it is unknown or its weights are all zero)
+        t = self.vocab.find(term)
+        if t < 0 or self.postings[t] is None:
+            return -1
+        return t
 
     def get_query_vector(self, query_str):
         # Converts query string to a vector (dict) using system IDF.
-        tokens = tokenize(query_str, self.stopwords)
+        with stage('vector.tokenize'):
+            tokens = tokenize(query_str, self.stopwords)
         tf_q = Counter(tokens)
         query_vec = {}
         
-        for term in self.vocab:
-            # Query weight = tf(in query) * idf(from collection)
-            tf_val = tf_q.get(term, 0)
-            query_vec[term] = tf_val * self.idf.get(term, 0)
+        # Sparse vector: only the query terms known by the collection
+        for term in sorted(tf_q):
+            t = self.vocab.find(term)
+            if t >= 0:
+                # Query weight = tf(in query) * idf(from collection)
+                query_vec[term] = tf_q[term] * self.idf[t]
             
         return query_vec
 
-    def cosine_similarity(self, vec_a, vec_b):
-        # Calculates cosine similarity between two vectors (dicts).
-        dot_product = 0.0
-        norm_a = 0.0
-        norm_b = 0.0
-
-        # We iterate over the vocabulary to ensure alignment
-        for term in self.vocab:
-            val_a = vec_a.get(term, 0)
-            val_b = vec_b.get(term, 0)
-            
-            dot_product += val_a * val_b
-            norm_a += val_a ** 2
-            norm_b += val_b ** 2
-
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        
-        return dot_product / (math.sqrt(norm_a) * math.sqrt(norm_b))
-    
-    def search(self, query_vec):
-        # Returns sorted list of (filename, score).
-        scores = []
-        for filename, doc_vec in self.weights.items():
-            sim = self.cosine_similarity(query_vec, doc_vec)
-            if sim > 0:
-                scores.append((filename, sim))
+    def doc_vector(self, filename):
+        # Returns the sparse vector of a document as a {term: tf-idf} dict.
+        term_ids, doc_weights = self.weights[self.doc_rank[filename]]
+        return {self.vocab[t]: w for t, w in zip(term_ids, doc_weights)}
+
+    def search(self, query_vec, k=None):
+        # Returns sorted list of (filename, score), or only the best k if k is given.
+        # Only the postings of the query terms are read; their weights are already
+        # divided by the document norms, so the sum is the cosine times |q|.
+        norm_q = math.sqrt(sum(w ** 2 for w in query_vec.values()))
+        if norm_q == 0:
+            return []
+
+        if k is not None:
+            return self.search_top_k(query_vec, k, norm_q)
+
+        # Term-at-a-time accumulation
+        with stage('vector.score'):
+            accumulators = defaultdict(float)
+            for term, q_weight in query_vec.items():
+                t = self.term_id(term)
+                if q_weight == 0 or t < 0:
+                    continue
+                doc_numbers, normalized = self.postings[t]
+                count('vector.postings_read', len(doc_numbers))
+                for doc, d_weight in zip(doc_numbers, normalized):
+                    accumulators[doc] += q_weight * d_weight
+
+            scores = [(doc, acc / norm_q) for doc, acc in accumulators.items() if acc > 0]
         
-        # Sort by score descending
-        return sorted(scores, key=lambda x: x[1], reverse=True)
+        # Sort by score descending (ties keep the document order)
+        with stage('vector.sort'):
+            scores.sort(key=lambda x: (-x[1], x[0]))
+        return [(self.doc_names[doc], score) for doc, score in scores]
+
+    def search_top_k(self, query_vec, k, norm_q):
+        # Document-at-a-time with MaxScore pruning: same results as the full ranking
+        cursors = []
+        for order, (term, q_weight) in enumerate(query_vec.items()):
+            t = self.term_id(term)
+            if q_weight == 0 or t < 0:
+                continue
+            doc_numbers, normalized = self.postings[t]
+            cursors.append(TermCursor(doc_numbers, normalized, q_weight, self.max_weights[t], order))
+
+        with stage('vector.top_k'):
+            results = max_score_top_k(cursors, k, min_score=0.0)
+        return [(self.doc_names[doc], acc / norm_q) for doc, acc in results]
+
+    def search_batch(self, queries, k=10, batch_size=BATCH_QUERIES):
+        # Yields (query, top-k results) for every query string, in input order.
+        # Each batch is a sparse query matrix multiplied by the document matrix term by term:
+        # the term of every query is looked up once, and its postings list is added to the
+        # accumulators of each query (column) that contains it. Looping over the columns
+        # inside the postings loop instead was slower in CPython (one more loop per posting).
+        # Repeated queries (frequent in logs) are scored once per batch.
+        queries = iter(queries)
+        while True:
+            batch = list(islice(queries, batch_size))
+            if not batch:
+                break
+
+            vectors = {} # {query vector: column number}
+            columns = [] # query number -> column number
+            for query_str in batch:
+                vec = tuple(self.get_query_vector(query_str).items())
+                columns.append(vectors.setdefault(vec, len(vectors)))
+
+            # Sparse query matrix, term-major: {term id: [(column, query weight)]}
+            query_matrix = defaultdict(list)
+            for vec, column in vectors.items():
+                for term, q_weight in vec:
+                    t = self.term_id(term)
+                    if q_weight != 0 and t >= 0:
+                        query_matrix[t].append((column, q_weight))
+
+            # Terms in vocabulary order, so every score adds up exactly like search()
+            accumulators = [defaultdict(float) for _ in vectors]
+            for t in sorted(query_matrix):
+                doc_numbers, normalized = self.postings[t]
+                for column, q_weight in query_matrix[t]:
+                    acc = accumulators[column]
+                    for doc, d_weight in zip(doc_numbers, normalized):
+                        acc[doc] += q_weight * d_weight
+
+            # The k-th best value is found on the bare floats (no key function), then only
+            # the documents that reach it are ranked, by the same sum as search_top_k
+            results = []
+            for vec, acc in zip(vectors, accumulators):
+                norm_q = math.sqrt(sum(w ** 2 for _, w in vec))
+                values = heapq.nlargest(k, acc.values())
+                threshold = values[-1] if values else 0.0
+                scores = [(doc, value) for doc, value in acc.items() if value >= threshold and value > 0]
+                results.append([(self.doc_names[doc], value / norm_q) for doc, value in top_k(scores, k)])
+
+            for query_str, column in zip(batch, columns):
+                yield query_str, results[column]
+
+    def search_batch_file(self, input_path, output, k=10, batch_size=BATCH_QUERIES):
+        # Scores a file with one query per line and writes one JSON line per query to 'output'
+        count = 0
+        with open(input_path, 'r', encoding='utf-8') as f:
+            queries = (line.strip() for line in f)
+            for query_str, results in self.search_batch(queries, k, batch_size):
+                output.write(json.dumps({'query': query_str, 'results': results}) + '\n')
+                count += 1
+        return count
     
-    def rocchio_feedback(self, original_q_vec, rel_docs, non_rel_docs):
-        # Implements: q_m = alpha*q_0 + beta*(1/|Dr| * sum(Dr)) - gamma*(1/|Dnr| * sum(Dnr))
-        new_q_vec = {}
-
-        # Pre-calculate centroids
-        # We need to process every term in the vocabulary
-        for term in self.vocab:
-            # 1. Alpha * Original
-            val_original = original_q_vec.get(term, 0) * ALPHA
-            
-            # 2. Beta * Average Relevant
-            sum_rel = sum(self.weights[doc][term] for doc in rel_docs)
-            avg_rel = (sum_rel / len(rel_docs)) if rel_docs else 0
-            val_rel = BETA * avg_rel
-            
-            # 3. Gamma * Average Non-Relevant
-            sum_nrel = sum(self.weights[doc][term] for doc in non_rel_docs)
-            avg_nrel = (sum_nrel / len(non_rel_docs)) if non_rel_docs else 0
-            val_nrel = GAMMA * avg_nrel
-            
-            # Combine
-            new_weight = val_original + val_rel - val_nrel
-            
-            # Negative weights are usually handled by setting to 0 in standard VSM,
-            # though strict Rocchio allows them (to penalize terms). 
-            # We will keep them, but cosine handles them naturally (penalizing match).
-            if new_weight < 0: 
-                new_weight = 0 # It is safer to clamp to 0 for standard search engines
-                
-            new_q_vec[term] = new_weight
-            
-        return new_q_vec
+    def centroid(self, docs):
+        # Mean of the sparse tf-idf vectors of 'docs', as {term id: weight}
+        total = defaultdict(float)
+        for doc in docs:
+            term_ids, doc_weights = self.weights[self.doc_rank[doc]]
+            for t, w in zip(term_ids, doc_weights):
+                total[t] += w
+
+        return {t: w / len(docs) for t, w in total.items()}
+
+    def rocchio_feedback(self, original_q_vec, rel_docs, non_rel_docs, top_m=ROCCHIO_TOP_M):
+        # Implements: q_m = alpha*q_0 + beta*centroid(Dr) - gamma*centroid(Dnr)
+        # Only the non-zero terms of the query and of the judged documents can change.
+        # With top_m, only the m heaviest expansion terms (not in q_0) are added.
+        with stage('vector.rocchio'):
+            new_q = defaultdict(float)
+            for term, w in original_q_vec.items():
+                # A term unknown to the collection has no id (find returns -1)
+                t = self.vocab.find(term)
+                if t >= 0:
+                    new_q[t] += ALPHA * w
+
+            if rel_docs:
+                for t, w in self.centroid(rel_docs).items():
+                    new_q[t] += BETA * w
+
+            if non_rel_docs:
+                for t, w in self.centroid(non_rel_docs).items():
+                    new_q[t] -= GAMMA * w
+
+        # Negative weights are usually handled by setting to 0 in standard VSM,
+        # though strict Rocchio allows them (to penalize terms).
+        # It is safer to clamp to 0 for standard search engines, so they are dropped.
+        kept = {t: w for t, w in new_q.items() if w > 0}
+
+        if top_m is not None:
+            original = {self.vocab.find(term) for term in original_q_vec}
+            expansion = [t for t in kept if t not in original]
+            expansion.sort(key=lambda t: (-kept[t], t))
+            for t in expansion[top_m:]:
+                del kept[t]
+
+        # Term ids follow the vocabulary order
+        return {self.vocab[t]: kept[t] for t in sorted(kept)}
 
 # Function for main and menu
 def print_menu():
@@ -211,11 +320,16 @@ def print_menu():
     print("f) Resolve a query with feedback.")
     print("g) Exit.")
 
-def main():
+def load_engine():
     engine = SearchEngine()
     engine.load_documents()
+    return engine
 
-    if len(engine.documents) == 0:
+def main():
+    # The engine is kept with the shared corpus, so coming back to this model is free
+    engine = get_corpus().cached('vector-model', load_engine)
+
+    if len(engine.doc_names) == 0:
         print("No documents have been uploaded. Check the 'data' directory.")
         # We allow the program to continue but most options will be empty
         
@@ -225,23 +339,23 @@ def main():
 
         if choice == 'a':
             print("\nAvailable documents:")
-            for doc in engine.documents.keys():
+            for doc in engine.doc_names:
                 print(f" - {doc}")
 
         elif choice == 'b':
             fname = input("Insert the name of the file (ej: d1.rep): ")
-            if fname in engine.documents:
+            if fname in engine.doc_rank:
                 print(f"\n--- Content of {fname} ---")
-                print(engine.documents[fname])
+                print(read_document(fname))
             else:
                 print("Error: Document not found.")
 
         elif choice == 'c':
             fname = input("Insert the name of the file (ej: d1.rep): ")
-            if fname in engine.weights:
+            if fname in engine.doc_rank:
                 print(f"\n--- (Weights TF-IDF) of {fname} ---")
                 # Showing only non-zero weights for readability
-                vec = {k: v for k, v in engine.weights[fname].items() if v > 0}
+                vec = {k: v for k, v in engine.doc_vector(fname).items() if v > 0}
                 print(vec)
             else:
                 print("Error: Document no found.")
@@ -253,15 +367,16 @@ def main():
         elif choice == 'e':
             print("\n--- Frecuency Table ---")
             # Header
-            docs = list(engine.documents.keys())
+            docs = engine.doc_names
             header = "{:<15}".format("Term") + "".join([f"{d[:8]:<10}" for d in docs])
             print(header)
             print("-" * len(header))
             
-            for term in engine.vocab:
+            freqs = [dict(zip(*doc_tf)) for doc_tf in engine.tf] # doc number -> {term id: freq}
+            for t, term in enumerate(engine.vocab):
                 row = "{:<15}".format(term)
-                for doc in docs:
-                    freq = engine.tf[doc].get(term, 0)
+                for doc_freqs in freqs:
+                    freq = doc_freqs.get(t, 0)
                     row += f"{freq:<10}"
                 print(row)
 
@@ -270,9 +385,9 @@ def main():
             q_vec = engine.get_query_vector(query_str)
             
             # Initial Search
-            results = engine.search(q_vec)
+            results = engine.search(q_vec, MENU_RESULTS)
             
-            print(f"\nPreliminary results ({len(results)}):")
+            print(f"\nPreliminary results (best {len(results)}):")
             for i, (doc, score) in enumerate(results):
                 print(f"[{i+1}] {doc} (Sim: {score:.4f})")
             
@@ -302,7 +417,7 @@ def main():
                 new_q_vec = engine.rocchio_feedback(q_vec, rel_docs, nrel_docs)
                 
                 # Search with new query
-                new_results = engine.search(new_q_vec)
+                new_results = engine.search(new_q_vec, MENU_RESULTS)
                 
                 print(f"\n--- Final Results (Post-Rocchio) ---")
                 for i, (doc, score) in enumerate(new_results):
@@ -317,5 +432,37 @@ def main():
         else:
             print("Invalid option.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Vector space model (interactive menu by default).")
+    parser.add_argument('--batch', metavar='QUERIES',
+                        help="File with one query per line, scored without the menu.")
+    parser.add_argument('--output', help="JSONL file for the batch results (default: standard output).")
+    parser.add_argument('--k', type=int, default=10, help="Results per query in batch mode.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_QUERIES, help="Queries scored together.")
+    return parser.parse_args()
+
+def batch_main(args):
+    if not os.path.exists(args.batch):
+        print(f"Error: Query file not found: {args.batch}", file=sys.stderr)
+        return 1
+
+    engine = SearchEngine()
+    # The loading messages must not get mixed with the JSONL results
+    with redirect_stdout(sys.stderr):
+        engine.load_documents()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            count = engine.search_batch_file(args.batch, output, args.k, args.batch_size)
+        print(f"{count} queries scored, results saved to {args.output}.")
+    else:
+        engine.search_batch_file(args.batch, sys.stdout, args.k, args.batch_size)
+    return 0
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args = parse_args()
+
+    if args.batch:
+        sys.exit(batch_main(args))
+    else:
+        main()
\ No newline at end of file
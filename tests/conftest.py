@@ -0,0 +1,18 @@
+import os
+import sys
+import importlib.util
+
+# Shared setup of the test modules: the scripts live in src/ (flat modules, not a
+# package), so src/ goes on sys.path. pytest loads this file before collecting the
+# tests; the modules also import it, so that 'python -m unittest discover tests'
+# (which does not know about conftest.py) gets the same setup.
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# Function to import a model script (their names have dashes, e.g. vector-model.py)
+def load_script(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,100 @@
+import unittest
+from collections import Counter
+from contextlib import redirect_stdout
+from io import StringIO
+
+from conftest import load_script
+
+from indexing import InvertedIndex, load_index
+
+boolean = load_script('boolean_model', 'boolean-model.py')
+
+DOCUMENTS = {
+    'd1.rep': 'alfa beta gamma',
+    'd2.rep': 'alfa delta',
+    'd3.rep': 'beta delta gamma',
+    'd4.rep': 'gamma',
+}
+
+class QueryParserTest(unittest.TestCase):
+    def plan(self, query):
+        return str(boolean.compile_query(query))
+
+    def test_precedence(self):
+        self.assertEqual(self.plan('alfa OR beta AND gamma'), '(alfa OR (beta AND gamma))')
+        self.assertEqual(self.plan('alfa beta'), '(alfa AND beta)')
+        self.assertEqual(self.plan('(alfa OR beta) gamma'), '((alfa OR beta) AND gamma)')
+        self.assertEqual(self.plan('NOT alfa AND beta'), '(NOT alfa AND beta)')
+        self.assertEqual(self.plan('alfa NEAR/3 beta OR gamma'), '((alfa NEAR/3 beta) OR gamma)')
+        self.assertEqual(self.plan('alfa near beta'), f'(alfa NEAR/{boolean.DEFAULT_NEAR} beta)')
+
+    def test_flattening_and_double_negation(self):
+        self.assertEqual(self.plan('alfa AND (beta AND (gamma AND delta))'), '(alfa AND beta AND gamma AND delta)')
+        self.assertEqual(self.plan('NOT NOT alfa'), 'alfa')
+        self.assertEqual(self.plan('Álfa'), 'alfa')
+
+    def test_invalid_queries(self):
+        for query in ('', '   ', '(alfa', 'alfa)', 'alfa AND', 'OR alfa', 'NOT', '()',
+                      '"alfa', 'alfa NEAR', 'alfa NEAR/2 beta NEAR gamma', '!!!'):
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    boolean.compile_query(query)
+
+    def test_nesting_limit(self):
+        limit = boolean.MAX_NESTING
+        self.assertEqual(self.plan('(' * limit + 'alfa' + ')' * limit), 'alfa')
+        self.assertEqual(self.plan('NOT ' * limit + 'alfa'), 'alfa')
+        for query in ('(' * (limit + 1) + 'alfa' + ')' * (limit + 1),
+                      'NOT ' * (limit + 1) + 'alfa',
+                      '(' * 5000 + 'alfa' + ')' * 5000,
+                      '(' * 5000):
+            with self.assertRaises(ValueError):
+                boolean.compile_query(query)
+
+class BooleanEvaluationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = InvertedIndex()
+        cls.index.build_from_counts((name, Counter(text.split())) for name, text in sorted(DOCUMENTS.items()))
+
+    def search(self, query):
+        plan = boolean.compile_query(query)
+        return sorted(self.index.doc_map[doc_id] for doc_id in plan.evaluate(self.index))
+
+    def test_operators(self):
+        cases = {
+            'alfa': ['d1.rep', 'd2.rep'],
+            'alfa AND beta': ['d1.rep'],
+            'alfa OR beta': ['d1.rep', 'd2.rep', 'd3.rep'],
+            'gamma AND NOT beta': ['d4.rep'],
+            'NOT gamma': ['d2.rep'],
+            '(alfa OR delta) AND NOT (beta AND gamma)': ['d2.rep'],
+            'alfa AND zeta': [],
+            'zeta OR delta': ['d2.rep', 'd3.rep'],
+            'NOT zeta': sorted(DOCUMENTS),
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), expected)
+
+class PhraseTest(unittest.TestCase):
+    """Phrases and NEAR over the positional postings of the sample collection."""
+    @classmethod
+    def setUpClass(cls):
+        with redirect_stdout(StringIO()):
+            cls.index = load_index()
+
+    def search(self, query):
+        return [self.index.doc_map[doc_id] for doc_id in boolean.compile_query(query).evaluate(self.index)]
+
+    def test_phrase_and_near(self):
+        # file01.rep starts with "mentira esloganes populares"
+        self.assertIn('file01.rep', self.search('"mentira esloganes"'))
+        self.assertNotIn('file01.rep', self.search('"esloganes mentira"'))
+        self.assertIn('file01.rep', self.search('mentira NEAR/2 populares'))
+        self.assertIn('file01.rep', self.search('populares NEAR/2 mentira'))
+        self.assertNotIn('file01.rep', self.search('mentira NEAR/1 populares'))
+        self.assertIn('file01.rep', self.search('"mentira de esloganes"'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from conftest import load_script
+
+from impacts import ImpactIndex
+
+QUERIES = ['mentira gira', 'the joshua tree', 'u2 1991 bono', 'casa de papel', 'gira gira tour',
+           'zzzz', 'de la', '']
+
+class ImpactParityTest(unittest.TestCase):
+    """Without a budget, the impact-ordered evaluation gives the ranking of the vector model."""
+    @classmethod
+    def setUpClass(cls):
+        with redirect_stdout(StringIO()):
+            cls.engine = load_script('vector_model', 'vector-model.py').SearchEngine()
+            cls.engine.load_documents()
+        cls.impact_index = ImpactIndex.from_engine(cls.engine)
+
+    def test_parity_with_vector_model(self):
+        for query in QUERIES:
+            for k in (1, 5, 1000):
+                with self.subTest(query=query, k=k):
+                    query_vec = self.engine.get_query_vector(query)
+                    results, info = self.impact_index.search(query_vec, k)
+                    expected = self.engine.search(query_vec, k)
+                    self.assertTrue(info['complete'])
+                    self.assertTrue(info['safe'])
+                    self.assertEqual([name for name, _ in results], [name for name, _ in expected])
+                    for (_, a), (_, b) in zip(results, expected):
+                        self.assertAlmostEqual(a, b, places=9)
+
+    def test_budget_bound(self):
+        # Stopped before reading anything: every final score is within the bound
+        query_vec = self.engine.get_query_vector('mentira gira')
+        results, info = self.impact_index.search(query_vec, 5, budget_ms=0)
+        self.assertFalse(info['complete'])
+        self.assertEqual(results, [])
+        for _, score in self.engine.search(query_vec, 5):
+            self.assertLessEqual(score, info['bound'] + 1e-9)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import os
+import math
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from contextlib import redirect_stdout
+from io import StringIO
+
+import conftest # src/ on sys.path
+
+import indexing
+from corpus import get_corpus
+
+class LoadIndexTest(unittest.TestCase):
+    """load_index uses a saved segment only while it matches the .rep files."""
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'index.seg')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self, documents):
+        index = indexing.InvertedIndex()
+        index.build_from_counts(documents)
+        indexing.write_segment(self.path, index)
+
+    def load(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            index = indexing.load_index(self.path)
+        self.addCleanup(index.close_segment)
+        return index, output.getvalue()
+
+    def test_fresh_segment_is_used(self):
+        self.save(get_corpus().documents())
+        index, output = self.load()
+        self.assertIsNotNone(index.segment)
+        self.assertNotIn('Warning', output)
+
+    def test_stale_segment_is_rebuilt(self):
+        documents = list(get_corpus().documents())
+        self.save(documents[1:])
+        index, output = self.load()
+        self.assertIn('out of date', output)
+        self.assertIsNone(index.segment)
+        self.assertEqual(sorted(index.doc_map.values()), [name for name, _, _ in documents])
+
+    def test_corpus_index_is_built_once(self):
+        first, _ = self.load()
+        first.close_segment()
+        second, _ = self.load()
+        self.assertIs(first, second)
+        self.assertTrue(second.is_built)
+        self.assertIs(second, get_corpus().cached('inverted-index', lambda: None))
+
+    def test_changed_file_makes_the_segment_stale(self):
+        name, counts, (size, mtime_ns) = next(get_corpus().documents())
+        self.save([(name, counts, (size, mtime_ns + 1))] + list(get_corpus().documents())[1:])
+        index, output = self.load()
+        self.assertIn('out of date', output)
+        self.assertEqual(index.signature(), get_corpus().signature)
+
+def synthetic_documents():
+    # A term in every non-empty document, one with more than a block of postings,
+    # multi-byte terms and file names, and an empty document
+    documents = []
+    for i in range(300):
+        counts = Counter({'comun': 1 + i % 3, f'unico{i:03d}': 1})
+        if i % 2:
+            counts['ñandú'] = 70000 if i == 299 else i
+        documents.append((f'doc{i:03d}-é.rep', counts, (1000 + i, 10 ** 18 + i)))
+    documents.append(('vacio.rep', Counter(), (0, 5)))
+    return documents
+
+class SegmentRoundTripTest(unittest.TestCase):
+    """An index written to a segment reads back the same terms, documents and postings."""
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'sub', 'index.seg')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def round_trip(self, documents):
+        built = indexing.InvertedIndex()
+        built.build_from_counts(documents)
+        loaded = indexing.InvertedIndex()
+        with redirect_stdout(StringIO()):
+            built.save_index(self.path)
+            self.assertTrue(loaded.load_index(self.path))
+        self.addCleanup(loaded.close_segment)
+        return built, loaded
+
+    def assert_same_index(self, built, loaded):
+        self.assertIsNotNone(loaded.segment)
+        self.assertEqual(list(loaded.vocab_list), list(built.vocab_list))
+        self.assertEqual(dict(loaded.doc_map), built.doc_map)
+        self.assertEqual(loaded.signature(), built.signature())
+        for t, term in enumerate(built.vocab_list):
+            self.assertEqual(list(loaded.index[term].items()), list(built.index[term].items()), term)
+            self.assertEqual(list(loaded.index[term]), list(built.index[term]), term)
+            self.assertEqual(list(loaded.doc_ids(term)), list(built.doc_ids(term)), term)
+        self.assertNotIn('missing', loaded.index)
+        self.assertEqual(loaded.doc_ids('missing'), ())
+
+    def test_sample_collection(self):
+        self.assert_same_index(*self.round_trip(get_corpus().documents()))
+
+    def test_synthetic_collection(self):
+        built, loaded = self.round_trip(synthetic_documents())
+        self.assert_same_index(built, loaded)
+        self.assertEqual(len(loaded.doc_ids('comun')), 300)
+        self.assertEqual(loaded.index['comun'].idf, math.log10(301 / 300))
+        self.assertEqual(len(loaded.doc_ids('ñandú')), 150)
+
+    def test_empty_index(self):
+        built, loaded = self.round_trip([])
+        self.assertEqual(len(loaded.vocab_list), 0)
+        self.assertEqual(dict(loaded.doc_map), {})
+
+    def test_invalid_files(self):
+        os.makedirs(os.path.dirname(self.path))
+        for content in (b'', b'IRSEG', b'not a segment at all' * 20):
+            with self.subTest(content=content[:8]):
+                with open(self.path, 'wb') as f:
+                    f.write(content)
+                index = indexing.InvertedIndex()
+                with redirect_stdout(StringIO()) as output:
+                    self.assertFalse(index.load_index(self.path))
+                self.assertIn('Error', output.getvalue())
+                self.assertFalse(index.is_built)
+
+        # A truncated copy of a valid segment
+        indexing.write_segment(self.path, self.round_trip(synthetic_documents())[0])
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        with redirect_stdout(StringIO()):
+            self.assertFalse(indexing.InvertedIndex().load_index(self.path))
+
+class UpdateIndexTest(unittest.TestCase):
+    """update_index merges added, changed and deleted .rep files like a full rebuild."""
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'index.seg')
+        self.saved = indexing.PROCESSED_DIR
+        indexing.PROCESSED_DIR = self.tmp
+        self.write('a.rep', 'casa papel casa')
+        self.write('b.rep', 'papel tijera')
+        self.write('c.rep', 'piedra')
+
+    def tearDown(self):
+        indexing.PROCESSED_DIR = self.saved
+        shutil.rmtree(self.tmp)
+
+    def write(self, filename, text, mtime_ns=None):
+        path = os.path.join(self.tmp, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(text.split()) + '\n')
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def run_quietly(self, func, *args):
+        output = StringIO()
+        with redirect_stdout(output):
+            func(*args)
+        return output.getvalue()
+
+    def contents(self, index):
+        # {term: (idf, [(filename, tf)])}, independent of the doc ids
+        return {term: (round(index.index[term].idf, 12),
+                       sorted((index.doc_map[doc_id], tf) for doc_id, tf in index.index[term].items()))
+                for term in index.vocab_list}
+
+    def rebuilt(self):
+        index = indexing.InvertedIndex()
+        self.run_quietly(index.build_index)
+        return self.contents(index)
+
+    def test_first_update_builds_the_segment(self):
+        index = indexing.InvertedIndex()
+        self.assertIn('from scratch', self.run_quietly(index.update_index, self.path))
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_update_matches_a_rebuild(self):
+        self.run_quietly(indexing.InvertedIndex().update_index, self.path)
+
+        self.write('b.rep', 'papel tijera tijera piedra', mtime_ns=10 ** 18)
+        os.remove(os.path.join(self.tmp, 'c.rep'))
+        self.write('d.rep', 'tijera nueva')
+
+        index = indexing.InvertedIndex()
+        output = self.run_quietly(index.update_index, self.path)
+        self.addCleanup(index.close_segment)
+        self.assertIn('1 added, 1 changed, 1 deleted', output)
+        self.assertIsNotNone(index.segment)
+        self.assertEqual(self.contents(index), self.rebuilt())
+        self.assertEqual(index.signature(), indexing.collection_signature(self.tmp))
+
+    def test_unchanged_files(self):
+        self.run_quietly(indexing.InvertedIndex().update_index, self.path)
+        before = os.stat(self.path).st_mtime_ns
+
+        index = indexing.InvertedIndex()
+        self.assertIn('up to date', self.run_quietly(index.update_index, self.path))
+        self.addCleanup(index.close_segment)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, before)
+        self.assertEqual(self.contents(index), self.rebuilt())
+
+if __name__ == '__main__':
+    unittest.main()
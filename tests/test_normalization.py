@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from contextlib import redirect_stdout
+from io import StringIO
+
+import conftest # src/ on sys.path
+
+import normalization
+
+TEXTS = {
+    'a.txt': 'La Casa de Papel, ¡otra vez!',
+    'b.txt': 'Árbol   ÁRBOL árbol\nnúmero 42',
+    'c.txt': '',
+}
+STOPWORDS = {'la', 'de'}
+# Multi-byte and combining accents, punctuation, runs of every kind of whitespace
+ACCENTED = ('Canción  ÁRBOL\tpingüino, ñandú...\r\nCafe\u0301 de\u00a0la  Ω-mega '
+            'añoñoño\n\n  éé la ÜBER 42 x')
+CHUNK_SIZES = (1, 2, 3, 5, 7, 64)
+
+class NormalizeBatchTest(unittest.TestCase):
+    """The worker pool gives the same .rep files with every start method."""
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        self.processed_dir = os.path.join(self.tmp, 'processed')
+        os.makedirs(self.data_dir)
+        for filename, text in TEXTS.items():
+            with open(os.path.join(self.data_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(text)
+
+        self.saved = (normalization.DATA_DIR, normalization.PROCESSED_DIR)
+        normalization.DATA_DIR = self.data_dir
+        normalization.PROCESSED_DIR = self.processed_dir
+
+    def tearDown(self):
+        normalization.DATA_DIR, normalization.PROCESSED_DIR = self.saved
+        shutil.rmtree(self.tmp)
+
+    def read_rep(self, filename):
+        with open(os.path.join(self.processed_dir, filename), 'r', encoding='utf-8') as f:
+            return f.read().split()
+
+    def test_start_methods(self):
+        expected = {os.path.splitext(name)[0] + '.rep': normalization.clean_text(text, STOPWORDS)
+                    for name, text in TEXTS.items()}
+        self.assertEqual(expected['a.rep'], ['casa', 'papel', 'otra', 'vez'])
+
+        for method in multiprocessing.get_all_start_methods():
+            with self.subTest(start_method=method):
+                shutil.rmtree(self.processed_dir, ignore_errors=True)
+                manifest = {}
+                with redirect_stdout(StringIO()):
+                    errors = normalization.normalize_batch(
+                        sorted(TEXTS), STOPWORDS, workers=2, chunk_size=1, manifest=manifest,
+                        mp_context=multiprocessing.get_context(method))
+                self.assertEqual(errors, [])
+                self.assertEqual(sorted(manifest), sorted(TEXTS))
+                for rep_name, tokens in expected.items():
+                    self.assertEqual(self.read_rep(rep_name), tokens)
+
+    def test_missing_file_is_reported(self):
+        with redirect_stdout(StringIO()):
+            errors = normalization.normalize_batch(['a.txt', 'missing.txt'], STOPWORDS, workers=1,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        self.assertEqual([filename for filename, _ in errors], ['missing.txt'])
+        self.assertEqual(self.read_rep('a.rep'), ['casa', 'papel', 'otra', 'vez'])
+
+class ChunkBoundaryTest(unittest.TestCase):
+    """Streaming in tiny chunks gives the tokens of clean_text on the whole text."""
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved = (normalization.DATA_DIR, normalization.PROCESSED_DIR)
+        normalization.DATA_DIR = os.path.join(self.tmp, 'data')
+        normalization.PROCESSED_DIR = os.path.join(self.tmp, 'processed')
+        os.makedirs(normalization.DATA_DIR)
+
+    def tearDown(self):
+        normalization.DATA_DIR, normalization.PROCESSED_DIR = self.saved
+        shutil.rmtree(self.tmp)
+
+    def test_iter_clean_tokens(self):
+        expected = normalization.clean_text(ACCENTED, STOPWORDS)
+        self.assertIn('cancion', expected)
+        self.assertIn('cafe', expected)
+        for size in CHUNK_SIZES:
+            with self.subTest(chunk_size=size):
+                chunks = [ACCENTED[i:i + size] for i in range(0, len(ACCENTED), size)]
+                self.assertEqual(list(normalization.iter_clean_tokens(chunks, STOPWORDS)), expected)
+
+    def test_normalize_file(self):
+        # UTF-8 (chunks are counted in characters, not bytes) and the ISO-8859-1 fallback
+        latin = ACCENTED.replace('\u0301', '').replace('Ω', 'O')
+        for filename, text, encoding in (('utf8.txt', ACCENTED, 'utf-8'), ('latin.txt', latin, 'iso-8859-1')):
+            with open(os.path.join(normalization.DATA_DIR, filename), 'w', encoding=encoding) as f:
+                f.write(text)
+            expected = normalization.clean_text(text, STOPWORDS)
+            for size in CHUNK_SIZES:
+                with self.subTest(encoding=encoding, chunk_size=size):
+                    rep_name, n_terms, _ = normalization.normalize_file(filename, STOPWORDS, size)
+                    with open(os.path.join(normalization.PROCESSED_DIR, rep_name), 'r', encoding='utf-8') as f:
+                        self.assertEqual(f.read().split('\n'), expected)
+                    self.assertEqual(n_terms, len(expected))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import random
+import unittest
+from bisect import bisect_left
+
+from conftest import load_script
+
+from postings import PostingsBuilder, BLOCK_SIZE
+
+# Lengths around the block boundaries
+LENGTHS = [1, BLOCK_SIZE - 1, BLOCK_SIZE, BLOCK_SIZE + 1, 2 * BLOCK_SIZE, 2 * BLOCK_SIZE + 1]
+
+def random_postings(rng, df):
+    # Sorted doc ids with gaps and TFs of 1, 2 and 4 bytes
+    doc_ids, tfs = [], []
+    doc_id = 0
+    for _ in range(df):
+        doc_id += rng.choice([1, 3, 300, 70000])
+        doc_ids.append(doc_id)
+        tfs.append(rng.choice([1, 2, 255, 256, 70000]))
+    return doc_ids, tfs
+
+class CompressedPostingsTest(unittest.TestCase):
+    """Round trip of the block-compressed postings, with several terms in one store."""
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(7)
+        cls.lists = [random_postings(rng, df) for df in LENGTHS]
+        builder = PostingsBuilder()
+        for doc_ids, tfs in cls.lists:
+            builder.add_term(doc_ids, tfs, 0.5)
+        cls.store = builder.store()
+
+    def test_round_trip(self):
+        for t, (doc_ids, tfs) in enumerate(self.lists):
+            with self.subTest(df=len(doc_ids)):
+                postings = self.store.postings(t)
+                self.assertEqual(len(postings), len(doc_ids))
+                self.assertEqual(list(postings.items()), list(zip(doc_ids, tfs)))
+                self.assertEqual(list(postings), [(d, tf * 0.5) for d, tf in zip(doc_ids, tfs)])
+                self.assertEqual(list(postings.doc_ids), doc_ids)
+
+    def test_random_access_and_find(self):
+        for t, (doc_ids, _) in enumerate(self.lists):
+            with self.subTest(df=len(doc_ids)):
+                postings = self.store.postings(t)
+                view = postings.doc_ids
+                for i in sorted({0, len(doc_ids) - 1, BLOCK_SIZE - 1, BLOCK_SIZE} & set(range(len(doc_ids)))):
+                    self.assertEqual(view[i], doc_ids[i])
+                    self.assertEqual(view[i - len(doc_ids)], doc_ids[i])
+                    self.assertEqual(postings.find(doc_ids[i]), i)
+                self.assertEqual(postings.find(doc_ids[-1] + 1), -1)
+                self.assertEqual(postings.find(0), -1)
+                with self.assertRaises(IndexError):
+                    view[len(doc_ids)]
+
+    def test_seek(self):
+        for t, (doc_ids, _) in enumerate(self.lists):
+            view = self.store.postings(t).doc_ids
+            targets = {0, doc_ids[-1] + 1}
+            for d in doc_ids:
+                targets.update((d - 1, d, d + 1))
+            with self.subTest(df=len(doc_ids)):
+                for lo in sorted({0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, len(doc_ids)}):
+                    for target in sorted(targets):
+                        expected = bisect_left(doc_ids, target, min(lo, len(doc_ids)))
+                        self.assertEqual(view.seek(target, lo), expected, (lo, target))
+
+    def test_intersection_with_compressed_postings(self):
+        boolean = load_script('boolean_model', 'boolean-model.py')
+        rng = random.Random(11)
+        for t, (doc_ids, _) in enumerate(self.lists):
+            with self.subTest(df=len(doc_ids)):
+                shorter = sorted(rng.sample(doc_ids, min(5, len(doc_ids))) + [doc_ids[-1] + 1])
+                view = self.store.postings(t).doc_ids
+                self.assertEqual(boolean.intersect_postings(shorter, view), shorter[:-1])
+                self.assertEqual(boolean.difference_postings(shorter, view), shorter[-1:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import random
+import unittest
+from array import array
+from collections import Counter
+from contextlib import redirect_stdout
+from io import StringIO
+
+from conftest import load_script
+
+from ranking import TermCursor, max_score_top_k
+
+QUERIES = ['mentira gira', 'the joshua tree', 'u2 1991 bono', 'casa de papel', 'gira gira tour',
+           'zzzz', 'de la', '']
+
+def full_sort(lists):
+    # Term-at-a-time scores of every document, sorted like the models do (ties: smaller doc)
+    scores = {}
+    for docs, weights, scale in lists:
+        for i, doc in enumerate(docs):
+            scores[doc] = scores.get(doc, 0.0) + (scale if weights is None else scale * weights[i])
+    return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+class MaxScoreTest(unittest.TestCase):
+    """MaxScore returns the first k documents of the full sort, scores included."""
+    def check(self, lists, min_score=None):
+        expected = full_sort(lists)
+        if min_score is not None:
+            expected = [(doc, score) for doc, score in expected if score > min_score]
+        for k in range(1, len(expected) + 4):
+            cursors = [TermCursor(docs, weights, scale, max(weights) if weights is not None else 1.0, order)
+                       for order, (docs, weights, scale) in enumerate(lists)]
+            with self.subTest(k=k):
+                self.assertEqual(max_score_top_k(cursors, k, min_score), expected[:k])
+
+    def test_random_lists_with_ties(self):
+        # Small integer weights: many documents end with exactly the same score
+        rng = random.Random(7)
+        for _ in range(20):
+            lists = []
+            for _ in range(rng.randint(1, 4)):
+                docs = array('I', sorted(rng.sample(range(40), rng.randint(1, 15))))
+                weights = array('d', (rng.randint(1, 3) for _ in docs))
+                lists.append((docs, weights, float(rng.randint(1, 2))))
+            self.check(lists)
+            self.check(lists, min_score=0.0)
+
+    def test_constant_weights(self):
+        # weights=None (binary independence): every document of a list ties on that list
+        lists = [(array('I', [1, 3, 5, 7]), None, 2.0), (array('I', [3, 4, 5]), None, 2.0),
+                 (array('I', [0, 9]), None, 0.5)]
+        self.check(lists)
+
+    def test_k_larger_than_matches(self):
+        lists = [(array('I', [2, 4]), array('d', [1.0, 3.0]), 1.0)]
+        cursors = [TermCursor(docs, weights, scale, max(weights), 0) for docs, weights, scale in lists]
+        self.assertEqual(max_score_top_k(cursors, 10), [(4, 3.0), (2, 1.0)])
+        self.assertEqual(max_score_top_k([], 10), [])
+
+class ModelTopKTest(unittest.TestCase):
+    """The top-k paths of the models give the first k results of their full rankings."""
+    @classmethod
+    def setUpClass(cls):
+        with redirect_stdout(StringIO()):
+            cls.engine = load_script('vector_model', 'vector-model.py').SearchEngine()
+            cls.engine.load_documents()
+        cls.probabilistic = load_script('probabilistic', 'probabilistic.py')
+        cls.doc_names, cls.postings = cls.probabilistic.load_collection()
+
+    def test_vector_search_top_k(self):
+        for query in QUERIES:
+            query_vec = self.engine.get_query_vector(query)
+            ranking = self.engine.search(query_vec)
+            for k in (1, 2, 3, len(ranking) + 5):
+                with self.subTest(query=query, k=k):
+                    self.assertEqual(self.engine.search(query_vec, k), ranking[:k])
+
+    def test_probabilistic_top_k(self):
+        bm25 = self.probabilistic.load_bm25()
+        N = len(self.doc_names)
+        # Without feedback, and with the first document judged relevant
+        for relevant in ([], [0]):
+            for query in QUERIES:
+                terms = [t for t in (self.probabilistic.normalize_term(w) for w in query.split()) if t]
+                relevant_counts = Counter({term: sum(1 for doc in relevant if doc in self.postings.get(term, ()))
+                                           for term in set(terms)})
+                for rank, index in ((self.probabilistic.rank_documents, self.postings),
+                                    (self.probabilistic.rank_bm25, bm25)):
+                    ranking = rank(terms, index, N, relevant_counts, len(relevant))
+                    for k in (1, 2, 3, len(ranking) + 5):
+                        with self.subTest(model=rank.__name__, query=query, relevant=relevant, k=k):
+                            self.assertEqual(rank(terms, index, N, relevant_counts, len(relevant), k),
+                                             ranking[:k])
+
+if __name__ == '__main__':
+    unittest.main()
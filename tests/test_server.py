@@ -0,0 +1,83 @@
+import json
+import asyncio
+import unittest
+
+import conftest # src/ on sys.path
+
+import server
+
+class QueryServiceTest(unittest.TestCase):
+    """Answers of the query server over the sample collection in processed/."""
+    @classmethod
+    def setUpClass(cls):
+        cls.service = server.QueryService()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.service.index.close_segment()
+
+    def ask(self, request):
+        line = request if isinstance(request, bytes) else json.dumps(request).encode('utf-8')
+        return json.loads(self.service.answer(line))
+
+    def test_every_model_answers(self):
+        for model in ('boolean', 'vector', 'probabilistic', 'bm25', 'impact'):
+            response = self.ask({'id': model, 'model': model, 'query': 'mentira gira', 'k': 3})
+            self.assertEqual(response['id'], model)
+            self.assertIn('results', response, response)
+            self.assertIn('latency_ms', response)
+
+    def test_k_limits_the_results(self):
+        response = self.ask({'model': 'vector', 'query': 'mentira gira zoo', 'k': 1})
+        self.assertEqual(len(response['results']), 1)
+
+    def test_malformed_requests_get_an_error(self):
+        bad_requests = [
+            b'not json',
+            b'[1, 2]',
+            {'id': 1, 'model': 'unknown', 'query': 'a'},
+            {'id': 2, 'model': ['vector'], 'query': 'a'},
+            {'id': 3, 'model': 'probabilistic', 'query': 123},
+            {'id': 4, 'model': 'vector', 'query': None},
+            {'id': 5, 'model': 'vector', 'query': 'a', 'k': 2.5},
+            {'id': 6, 'model': 'vector', 'query': 'a', 'k': 0},
+            {'id': 7, 'model': 'bm25', 'query': 'a', 'k': True},
+            {'id': 8, 'model': 'impact', 'query': 'a', 'budget_ms': 'fast'},
+            {'id': 9, 'model': 'probabilistic', 'query': 'a', 'relevant': 'file01.rep'},
+            {'id': 10, 'model': 'boolean', 'query': '(a AND'},
+        ]
+        for request in bad_requests:
+            response = self.ask(request)
+            self.assertIn('error', response, request)
+            self.assertNotIn('results', response)
+
+    def test_stats(self):
+        self.ask({'model': 'vector', 'query': 'mentira'})
+        stats = self.ask({'id': 'stats', 'op': 'stats'})['stats']
+        self.assertGreaterEqual(stats['vector']['requests'], 1)
+
+    def test_pipelined_connection_survives_bad_requests(self):
+        lines = [
+            {'id': 1, 'model': 'probabilistic', 'query': 123},
+            {'id': 2, 'model': 'vector', 'query': 'mentira', 'k': 2},
+        ]
+
+        async def exchange():
+            tcp_server = await asyncio.start_server(self.service.handle_client, '127.0.0.1', 0)
+            port = tcp_server.sockets[0].getsockname()[1]
+            async with tcp_server:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(b''.join(json.dumps(line).encode('utf-8') + b'\n' for line in lines))
+                await writer.drain()
+                answers = [json.loads(await reader.readline()) for _ in lines]
+                writer.close()
+                await writer.wait_closed()
+            return answers
+
+        answers = asyncio.run(exchange())
+        self.assertEqual([answer['id'] for answer in answers], [1, 2])
+        self.assertIn('error', answers[0])
+        self.assertIn('results', answers[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from conftest import load_script
+
+import sharding
+
+QUERIES = ['mentira gira', 'the joshua tree', 'u2 1991 bono', 'casa de papel', 'zzzz', 'de la', '']
+
+class ShardParityTest(unittest.TestCase):
+    """Scatter-gather over the shards gives the ranking of the single-index vector model."""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.saved = (sharding.SHARDS_DIR, sharding.GLOBAL_STATS_FILE)
+        sharding.SHARDS_DIR = cls.tmp
+        sharding.GLOBAL_STATS_FILE = os.path.join(cls.tmp, 'global.json')
+
+        with redirect_stdout(StringIO()):
+            cls.engine = load_script('vector_model', 'vector-model.py').SearchEngine()
+            cls.engine.load_documents()
+
+    @classmethod
+    def tearDownClass(cls):
+        sharding.SHARDS_DIR, sharding.GLOBAL_STATS_FILE = cls.saved
+        shutil.rmtree(cls.tmp)
+
+    def assert_same_results(self, sharded, single):
+        self.assertEqual([name for name, _ in sharded], [name for name, _ in single])
+        for (_, a), (_, b) in zip(sharded, single):
+            self.assertAlmostEqual(a, b, places=9)
+
+    def test_parity_with_single_index(self):
+        for n_shards in (1, 3):
+            with redirect_stdout(StringIO()):
+                self.assertTrue(sharding.build_shards(n_shards, workers=2))
+            searcher = sharding.ShardedSearch(workers=1)
+            try:
+                for query in QUERIES:
+                    with self.subTest(shards=n_shards, query=query):
+                        single = self.engine.search(self.engine.get_query_vector(query), k=5)
+                        self.assert_same_results(searcher.search(query, 5), single)
+            finally:
+                searcher.close()
+
+    def test_stopwords_and_numbers_are_not_indexed(self):
+        with redirect_stdout(StringIO()):
+            self.assertTrue(sharding.build_shards(2, workers=1))
+        searcher = sharding.ShardedSearch(workers=1)
+        try:
+            self.assertNotIn('de', searcher.idf)
+            self.assertFalse(any(term.isnumeric() for term in searcher.idf))
+            self.assertEqual(searcher.search('de 1991', 5), [])
+        finally:
+            searcher.close()
+
+if __name__ == '__main__':
+    unittest.main()
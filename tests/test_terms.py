@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from conftest import load_script
+
+import indexing
+from corpus import get_corpus
+from terms import TermDictionary, TermMap, BLOCK_TERMS
+
+# Sorted by code point (== utf-8 byte order), with shared prefixes and multi-byte characters
+TERMS = sorted(['a', 'ab', 'abc', 'abd', 'b', 'casa', 'casas', 'caso', 'ñu', 'ñandu', 'über',
+                'uber', 'zeta', 'año', 'anos', 'x', 'xy', 'xyz', 'yo', 'é', 'éte', 'ü', '東京', '東'])
+
+class TermDictionaryTest(unittest.TestCase):
+    def setUp(self):
+        self.terms = TermDictionary.from_sorted(TERMS)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.terms), len(TERMS))
+        self.assertEqual(list(self.terms), TERMS)
+        self.assertEqual([self.terms[t] for t in range(len(TERMS))], TERMS)
+        self.assertEqual(self.terms[-1], TERMS[-1])
+        self.assertEqual(self.terms[2:5], TERMS[2:5])
+        copy = self.terms.copy()
+        self.assertEqual(list(copy), TERMS)
+        with self.assertRaises(IndexError):
+            self.terms[len(TERMS)]
+
+    def test_find_at_block_boundaries(self):
+        self.assertGreater(len(TERMS), BLOCK_TERMS + 1)
+        for t in (0, BLOCK_TERMS - 1, BLOCK_TERMS, len(TERMS) - 1):
+            self.assertEqual(self.terms.find(TERMS[t]), t)
+        for t, term in enumerate(TERMS):
+            self.assertEqual(self.terms.find(term), t)
+
+    def test_multibyte_terms(self):
+        for term in ('ñu', 'über', 'é', '東京'):
+            self.assertIn(term, self.terms)
+            self.assertEqual(self.terms[self.terms.find(term)], term)
+
+    def test_missing_terms(self):
+        for term in ('', 'aa', 'abcd', 'c', 'ñ', 'zz', '東京都', '￿'):
+            self.assertEqual(self.terms.find(term), -1, term)
+            self.assertNotIn(term, self.terms)
+        self.assertNotIn(3, self.terms)
+        self.assertEqual(TermDictionary.from_sorted([]).find('a'), -1)
+
+    def test_term_map(self):
+        values = [None if t % 2 else t for t in range(len(TERMS))]
+        view = TermMap(self.terms, values)
+        self.assertEqual(dict(view), {term: t for t, term in enumerate(TERMS) if t % 2 == 0})
+        with self.assertRaises(KeyError):
+            view[TERMS[1]]
+        with self.assertRaises(KeyError):
+            view['missing']
+
+class SegmentTermsTest(unittest.TestCase):
+    """Term ids after a segment is saved, loaded and closed."""
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'index.seg')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_segment_terms_and_close(self):
+        built = indexing.InvertedIndex()
+        built.build_from_counts(get_corpus().documents())
+        indexing.write_segment(self.path, built)
+
+        index = indexing.InvertedIndex()
+        with redirect_stdout(StringIO()):
+            self.assertTrue(index.load_index(self.path))
+        self.assertEqual(list(index.vocab_list), list(built.vocab_list))
+        for t, term in enumerate(built.vocab_list):
+            self.assertEqual(index.term_number(term), t)
+
+        index.close_segment()
+        self.assertFalse(index.is_built)
+        self.assertEqual(len(index.vocab_list), 0)
+        self.assertEqual(index.term_number(built.vocab_list[0]), -1)
+        self.assertEqual(index.doc_ids(built.vocab_list[0]), ())
+
+class RocchioTermsTest(unittest.TestCase):
+    def test_unknown_query_terms_are_skipped(self):
+        vector = load_script('vector_model', 'vector-model.py')
+        engine = vector.SearchEngine()
+        engine.set_counts(['d1', 'd2', 'd3'], [{'alfa': 2, 'beta': 1}, {'beta': 3}, {'gamma': 1}])
+        new_q = engine.rocchio_feedback({'alfa': 1.0, 'zzz': 5.0}, ['d1'], [], top_m=None)
+        self.assertNotIn('zzz', new_q)
+        self.assertNotIn('gamma', new_q)
+        self.assertIn('alfa', new_q)
+
+if __name__ == '__main__':
+    unittest.main()